@@ -2,36 +2,138 @@
  * app/api/ui-config/route.js
  * Proxies the student's CAP profile to the Python ML prediction server
  * and returns the optimal UI configuration.
+ *
+ * Answers are kept in an in-memory cache keyed by the canonical profile and
+ * follow the Cache-Control the ML server sends (max-age, stale-while-revalidate):
+ *   fresh   served from memory without contacting the server
+ *   stale   served from memory, revalidated in the background with the entry's
+ *           ETag (a 304 just extends it, no model call on the Python side)
+ *   miss    fetched, bounded by ML_TIMEOUT_MS; if the server is slow or down an
+ *           expired entry is still preferred over the defaults
+ * The global fetch keeps pooled keep-alive connections to the server, so
+ * repeat requests skip the TCP handshake (ml/serve.py keeps them open).
  */
 
+const ML_URL = process.env.ML_SERVER_URL ?? 'http://localhost:5001'
+const ML_TIMEOUT_MS = Number(process.env.ML_TIMEOUT_MS ?? 1500)
+const CACHE_MAX_ENTRIES = 1000
+
+const FALLBACK_CONFIG = {
+    color_theme: 'neutral',
+    font_family: 'inter',
+    font_size: 'default',
+    motion: 'reduced',
+    info_density: 'moderate',
+    large_targets: false,
+    read_aloud: false,
+    progress_bars: true,
+    no_timers: false,
+}
+
+// profile key → { data, etag, freshUntil, staleUntil }, oldest first (Map keeps insertion order)
+const cache = new Map()
+// profile key → in-flight request, so concurrent loads of one profile share it
+const inFlight = new Map()
+
+/** Same key for the same profile regardless of field or flag order. */
+function profileKey(capProfile) {
+    const canonical = value => {
+        if (Array.isArray(value)) return value.map(canonical).sort()
+        if (value && typeof value === 'object') {
+            return Object.fromEntries(Object.keys(value).sort().map(k => [k, canonical(value[k])]))
+        }
+        return value
+    }
+    return JSON.stringify(canonical(capProfile ?? {}))
+}
+
+/** Seconds of max-age and stale-while-revalidate in a Cache-Control header (0 when absent). */
+function cacheLifetimes(header) {
+    const seconds = name => Number(header?.match(new RegExp(`${name}=(\\d+)`))?.[1] ?? 0)
+    return { maxAge: seconds('max-age'), staleWhileRevalidate: seconds('stale-while-revalidate') }
+}
+
+function remember(key, entry) {
+    cache.delete(key)
+    cache.set(key, entry)
+    if (cache.size > CACHE_MAX_ENTRIES) cache.delete(cache.keys().next().value)
+}
+
+function requestConfig(capProfile, etag) {
+    const headers = { 'Content-Type': 'application/json' }
+    if (etag) headers['If-None-Match'] = etag
+    return fetch(`${ML_URL}/predict`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ cap_profile: capProfile }),
+        signal: AbortSignal.timeout(ML_TIMEOUT_MS),
+    })
+}
+
+async function fetchConfig(key, capProfile) {
+    // Revalidate only with a body in hand to reuse: a 304 carries none
+    const cached = cache.get(key)
+    const reusable = cached?.data !== undefined && cached.etag
+    let res = await requestConfig(capProfile, reusable ? cached.etag : null)
+    if (res.status === 304 && !reusable) {
+        res = await requestConfig(capProfile, null)
+    }
+
+    let data
+    if (res.status === 304 && reusable) {
+        data = cached.data
+    } else if (res.ok) {
+        data = await res.json()
+    } else {
+        throw new Error(`ML server error: ${res.status}`)
+    }
+
+    const { maxAge, staleWhileRevalidate } = cacheLifetimes(res.headers.get('cache-control'))
+    const now = Date.now()
+    remember(key, {
+        data,
+        etag: res.headers.get('etag') ?? (reusable ? cached.etag : undefined),
+        freshUntil: now + maxAge * 1000,
+        staleUntil: now + (maxAge + staleWhileRevalidate) * 1000,
+    })
+    return data
+}
+
+function revalidate(key, capProfile) {
+    if (!inFlight.has(key)) {
+        inFlight.set(key, fetchConfig(key, capProfile).finally(() => inFlight.delete(key)))
+    }
+    return inFlight.get(key)
+}
+
 export async function POST(request) {
+    let cached
     try {
         const { capProfile } = await request.json()
+        const key = profileKey(capProfile)
+        cached = cache.get(key)
+        const now = Date.now()
 
-        const res = await fetch('http://localhost:5001/predict', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ cap_profile: capProfile }),
-        })
+        if (cached && now < cached.freshUntil) {
+            remember(key, cached)
+            return Response.json(cached.data, { headers: { 'X-UI-Config-Cache': 'fresh' } })
+        }
+        if (cached && now < cached.staleUntil) {
+            revalidate(key, capProfile).catch(() => { /* keep serving the stale entry */ })
+            return Response.json(cached.data, { headers: { 'X-UI-Config-Cache': 'stale' } })
+        }
 
-        if (!res.ok) throw new Error(`ML server error: ${res.status}`)
-        const data = await res.json()
-        return Response.json(data)
+        const data = await revalidate(key, capProfile)
+        return Response.json(data, { headers: { 'X-UI-Config-Cache': 'miss' } })
 
     } catch (err) {
+        // An expired answer for this student beats the generic defaults
+        if (cached) {
+            return Response.json(cached.data, { headers: { 'X-UI-Config-Cache': 'stale-if-error' } })
+        }
         // Fallback: return safe defaults so the UI never breaks
         return Response.json({
-            ui_config: {
-                color_theme: 'neutral',
-                font_family: 'inter',
-                font_size: 'default',
-                motion: 'reduced',
-                info_density: 'moderate',
-                large_targets: false,
-                read_aloud: false,
-                progress_bars: true,
-                no_timers: false,
-            },
+            ui_config: FALLBACK_CONFIG,
             fallback: true,
             error: err.message,
         })
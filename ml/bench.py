@@ -0,0 +1,464 @@
+"""
+ml/bench.py
+Reproducible offline benchmark suite for the ML pipeline, one suite per area:
+
+  generation  scalar vs vectorized synthetic rows per second
+  formats     CSV vs Parquet / Feather: size, write and training-load time
+  training    per-target forest fit time
+  modes       nine separate forests vs one fused multi-output forest: fit time,
+              size, memory, load time, latency and test accuracy
+  bundle      pickle / flat export / lookup table size and load time
+  serving     single + batched predict latency through Flask's in-process test
+              client (no network); batch answers are checked against /predict
+  rules       rule engine vs forests: latency, and agreement over the domain
+  startup     cold-start import time and memory of the serving and training modules
+
+Every metric is recorded with its unit and whether lower or higher is better,
+and the run is written as JSON together with the environment it ran in.
+--baseline compares against an earlier results file and exits non-zero when
+any metric got worse by more than --tolerance.
+
+Run:     python3 ml/bench.py                      (all suites → ml/bench_results.json)
+         python3 ml/bench.py --suites generation,serving --quick
+Compare: python3 ml/bench.py --baseline ml/bench_baseline.json [--tolerance 0.15]
+Save a baseline: cp ml/bench_results.json ml/bench_baseline.json
+Requires: the trained model files for the bundle, serving and rules suites (run train_model.py
+          first); pyarrow for the Parquet / Feather rows of the formats suite
+
+Inputs are seeded, so reruns on the same box measure the same work; timings
+are the best of --repeats runs to keep scheduler noise out of comparisons.
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+import numpy as np
+
+SUITES        = ["generation", "formats", "training", "modes", "bundle", "serving", "rules", "startup"]
+RESULTS_PATH  = "ml/bench_results.json"
+FORMAT_NAME   = "vantage-bench"
+
+# CAP field values the onboarding flow writes, for random serving profiles
+SUPPORT  = ["reminder", "step-by-step", "full-agent"]
+DENSITY  = ["summary", "moderate", "full"]
+HORIZON  = ["24h", "72h", "1week", "2weeks"]
+SENSORY  = ["loud", "bright", "crowds", "open"]
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+class Results:
+    """Flat {name: {value, unit, better}} record of one run."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better="lower"):
+        self.metrics[name] = {"value": float(value), "unit": unit, "better": better}
+        print(f"  {name:52s}  {value:14,.3f} {unit}")
+
+def best_of(fn, repeats):
+    """Minimum wall-clock seconds of fn() over `repeats` runs."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def latencies(fn, n):
+    """Per-call seconds of n calls to fn(i)."""
+    samples = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples[i] = time.perf_counter() - t0
+    return samples
+
+def random_caps(n, disorders, seed=42):
+    """Random CAP profiles drawn from the same fields the onboarding flow writes."""
+    rng = random.Random(seed)
+    return [
+        {
+            "support_level":       rng.choice(SUPPORT),
+            "information_density": rng.choice(DENSITY),
+            "time_horizon":        rng.choice(HORIZON),
+            "sensory_flags":       rng.sample(SENSORY, rng.randint(0, 2)),
+            "disorders":           rng.sample(disorders, rng.choice([0, 1, 1, 2, 2, 3])),
+        }
+        for _ in range(n)
+    ]
+
+def environment():
+    def version(dist):
+        try:
+            return metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            return None
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit":    commit,
+        "python":    platform.python_version(),
+        "platform":  platform.platform(),
+        "cpus":      os.cpu_count(),
+        "numpy":     np.__version__,
+        "sklearn":   version("scikit-learn"),
+        "flask":     version("flask"),
+    }
+
+# ── Suites ────────────────────────────────────────────────────────────────────
+def bench_generation(results, args):
+    import random
+    import generate_data
+
+    scalar_sizes = [1_000, 10_000] if not args.quick else [1_000]
+    vector_sizes = [10_000, 100_000, 1_000_000] if not args.quick else [10_000, 100_000]
+
+    for n in scalar_sizes:
+        def run():
+            random.seed(42)
+            [generate_data.generate_row() for _ in range(n)]
+        results.add(f"generation.scalar.n={n}.rows_per_s", n / best_of(run, args.repeats), "rows/s", "higher")
+
+    for n in vector_sizes:
+        run = lambda: generate_data.generate_chunk(np.random.default_rng(42), n)
+        results.add(f"generation.vectorized.n={n}.rows_per_s", n / best_of(run, args.repeats), "rows/s", "higher")
+
+def bench_formats(results, args):
+    import generate_data
+    import train_model
+
+    n = 200_000 if args.quick else 2_000_000
+    try:
+        import pyarrow  # noqa: F401
+        formats = [".csv", ".parquet", ".feather"]
+    except ImportError:
+        print("  (skipped parquet / feather: pyarrow is not installed)")
+        formats = [".csv"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in formats:
+            path = os.path.join(tmp, f"profiles{ext}")
+            write = lambda: generate_data.write_vectorized(path, n, 500_000, 42, progress=False)
+            results.add(f"formats.{ext[1:]}.n={n}.write_s", best_of(write, 1), "s")
+            results.add(f"formats.{ext[1:]}.n={n}.size_mb", os.path.getsize(path) / 1e6, "MB")
+            load = lambda: train_model.read_dataset(path)
+            results.add(f"formats.{ext[1:]}.n={n}.load_s",
+                        best_of(load, 1 if args.quick else min(args.repeats, 2)), "s")
+
+def bench_training(results, args):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    import train_model
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        X, ys, _ = train_model.load_training_data(args.data)
+    train_idx, _ = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+
+    total = 0.0
+    for target in train_model.ALL_TARGETS:
+        # Single-threaded, so the number does not depend on the core count
+        fit = lambda: RandomForestClassifier(**dict(train_model.RF_PARAMS, n_jobs=1)).fit(
+            X[train_idx], ys[target][train_idx])
+        seconds = best_of(fit, 1 if args.quick else min(args.repeats, 2))
+        total  += seconds
+        results.add(f"training.fit.{target}.s", seconds, "s")
+    results.add("training.fit.all_targets.s", total, "s")
+
+def bench_modes(results, args):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    import train_model
+    from fused import FusedTargetModel
+    from lookup_table import predict_codes
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        X, ys, encoders = train_model.load_training_data(args.data)
+    # Same split train_model uses, so accuracy is on identical held-out rows
+    train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+    Y = np.column_stack([ys[t] for t in train_model.ALL_TARGETS])
+    forest = lambda: RandomForestClassifier(**dict(train_model.RF_PARAMS, n_jobs=1))
+
+    def fit_separate():
+        return {t: forest().fit(X[train_idx], Y[train_idx, j]) for j, t in enumerate(train_model.ALL_TARGETS)}
+
+    def fit_fused():
+        shared = forest().fit(X[train_idx], Y[train_idx])
+        return {t: FusedTargetModel(shared, j) for j, t in enumerate(train_model.ALL_TARGETS)}
+
+    for mode, fit in (("separate", fit_separate), ("fused", fit_fused)):
+        t0     = time.perf_counter()
+        models = fit()
+        results.add(f"modes.{mode}.fit_s", time.perf_counter() - t0, "s")
+
+        blob = pickle.dumps(train_model.build_bundle(models, encoders))
+        results.add(f"modes.{mode}.pickle_mb", len(blob) / 1e6, "MB")
+        results.add(f"modes.{mode}.load_ms", best_of(lambda: pickle.loads(blob), args.repeats) * 1e3, "ms")
+        tracemalloc.start()
+        bundle = pickle.loads(blob)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.add(f"modes.{mode}.memory_mb", peak / 1e6, "MB")
+
+        X_test = X[test_idx]
+        lat = latencies(lambda i: predict_codes(bundle, X_test[i % len(X_test)][None, :]),
+                        50 if args.quick else 200)
+        results.add(f"modes.{mode}.predict.p50_ms", np.percentile(lat, 50) * 1e3, "ms")
+        results.add(f"modes.{mode}.predict.p99_ms", np.percentile(lat, 99) * 1e3, "ms")
+
+        accuracy = (predict_codes(bundle, X_test) == Y[test_idx]).mean(axis=0)
+        for target, acc in zip(train_model.ALL_TARGETS, accuracy):
+            results.add(f"modes.{mode}.accuracy.{target}", acc, "share", "higher")
+
+def bench_bundle(results, args):
+    import flat_forest
+    import lookup_table
+
+    path = lookup_table.BUNDLE_PATH
+    if os.path.exists(path):
+        results.add("bundle.pickle.size_mb", os.path.getsize(path) / 1e6, "MB")
+
+        def load():
+            with open(path, "rb") as f:
+                pickle.load(f)
+        results.add("bundle.pickle.load_ms", best_of(load, args.repeats) * 1e3, "ms")
+    else:
+        print(f"  (skipped pickle: {path} not found)")
+
+    if flat_forest.exists():
+        size = sum(os.path.getsize(os.path.join(flat_forest.FLAT_DIR, f"{n}.npy")) for n in flat_forest.ARRAYS)
+        results.add("bundle.flat.size_mb", size / 1e6, "MB")
+        results.add("bundle.flat.load_ms", best_of(flat_forest.load, args.repeats) * 1e3, "ms")
+
+    if os.path.exists(lookup_table.TABLE_PATH):
+        results.add("bundle.table.size_kb", os.path.getsize(lookup_table.TABLE_PATH) / 1e3, "KB")
+        results.add("bundle.table.load_ms", best_of(lookup_table.load_table, args.repeats) * 1e3, "ms")
+
+def bench_serving(results, args):
+    import predict_server
+
+    client = predict_server.app.test_client()
+    n_single = 200 if args.quick else 1000
+    caps = random_caps(max(n_single, 1000), predict_server.DISORDERS, seed=42)
+
+    # The batch endpoint must answer exactly what the single one does
+    single = [client.post("/predict", json={"cap_profile": cap}).get_json() for cap in caps[:200]]
+    batch  = client.post("/predict_batch", json={"cap_profiles": caps[:200]}).get_data(as_text=True)
+    if [json.loads(line) for line in batch.splitlines()] != single:
+        raise SystemExit("❌ /predict_batch results differ from /predict")
+
+    def serve(label):
+        # Warm up Flask and any lazily built state before timing
+        for cap in caps[:20]:
+            client.post("/predict", json={"cap_profile": cap})
+
+        lat = latencies(lambda i: client.post("/predict", json={"cap_profile": caps[i]}), n_single)
+        results.add(f"serving.{label}.single.p50_ms", np.percentile(lat, 50) * 1e3, "ms")
+        results.add(f"serving.{label}.single.p99_ms", np.percentile(lat, 99) * 1e3, "ms")
+        results.add(f"serving.{label}.single.req_per_s", n_single / lat.sum(), "req/s", "higher")
+
+        for size in (10, 100, 1000):
+            batch = caps[:size]
+            lat = latencies(lambda i: client.post("/predict_batch", json={"cap_profiles": batch}).get_data(),
+                            max(args.repeats * 2, 5))
+            results.add(f"serving.{label}.batch={size}.p50_ms", np.percentile(lat, 50) * 1e3, "ms")
+            results.add(f"serving.{label}.batch={size}.profiles_per_s",
+                        size / np.percentile(lat, 50), "profiles/s", "higher")
+
+    serve(predict_server.STATE.predictor)
+
+    # Forests with no table or cache in front: the cost of a cold profile
+    if predict_server.STATE.has_model:
+        saved = predict_server.STATE, predict_server.CACHE
+        forest = copy.copy(predict_server.STATE)
+        forest.predictor, forest.table = "model", None
+        predict_server.STATE, predict_server.CACHE = forest, None
+        n_single = min(n_single, 200)
+        try:
+            serve("forest")
+        finally:
+            predict_server.STATE, predict_server.CACHE = saved
+
+def bench_rules(results, args):
+    import flat_forest
+    import lookup_table
+    import rules
+
+    # The flat export if present, else the pickle bundle
+    if flat_forest.exists():
+        model = flat_forest.load()
+        codes_fn, targets, labels, version = (model.predict_codes, model.targets,
+                                              model.label_classes, model.bundle_version)
+    elif os.path.exists(lookup_table.BUNDLE_PATH):
+        bundle   = lookup_table.load_bundle()
+        codes_fn = lambda X: lookup_table.predict_codes(bundle, X)
+        targets  = lookup_table.bundle_targets(bundle)
+        labels   = {t: [str(c) for c in bundle["encoders"][t].classes_] for t in bundle["categorical_targets"]}
+        version  = lookup_table.bundle_version()
+    else:
+        print("  (skipped: no trained model files)")
+        return
+
+    X  = lookup_table.domain_features()
+    Xi = X.astype(np.int64)
+    disorder_mask = (Xi[:, lookup_table.DISORDER_COLS] << np.arange(lookup_table.N_DISORDERS)).sum(axis=1)
+    sensory_mask  = (Xi[:, lookup_table.SENSORY_COLS] << np.arange(lookup_table.N_SENSORY)).sum(axis=1)
+    support, density = Xi[:, lookup_table.SUPPORT_COL], Xi[:, lookup_table.DENSITY_COL]
+
+    # Agreement over the whole domain; the cells that differ are the ones hybrid mode hands to the model
+    model_codes = lookup_table.load_table(lookup_table.TABLE_PATH, version)
+    if model_codes is None:
+        model_codes = np.concatenate([codes_fn(X[s:s + 8192]) for s in range(0, len(X), 8192)])
+    table      = rules.compiled()
+    rule_cells = rules.rule_index(disorder_mask, support, density, sensory_mask)
+    agree = np.empty((len(X), len(targets)), dtype=bool)
+    for j, target in enumerate(targets):
+        if target in labels:
+            model_values = np.array(labels[target], dtype=object)[model_codes[:, j]]
+        else:
+            model_values = model_codes[:, j].astype(bool)
+        agree[:, j] = model_values == np.array([table[c][target] for c in rule_cells], dtype=object)
+    for j, target in enumerate(targets):
+        results.add(f"rules.agreement.{target}", agree[:, j].mean(), "share", "higher")
+    results.add("rules.agreement.whole_config", agree.all(axis=1).mean(), "share", "higher")
+
+    # Single-profile latency: compiled rules, rules evaluated from scratch, the forests
+    rows = np.random.default_rng(42).integers(0, len(X), size=100 if args.quick else 500)
+    def inputs(i):
+        return int(disorder_mask[i]), int(support[i]), int(density[i]), int(sensory_mask[i])
+    def evaluate(i):
+        d, s, p, f = inputs(i)
+        rules.compute_config(sorted(x for k, x in enumerate(rules.ALL_DISORDERS) if d >> k & 1),
+                             rules.SUPPORT_LEVELS[s], rules.DENSITY_PREFS[p],
+                             [x for k, x in enumerate(rules.SENSORY_FLAGS) if f >> k & 1])
+    for label, fn in (("compiled", lambda i: rules.lookup(*inputs(rows[i]))),
+                      ("evaluated", lambda i: evaluate(rows[i])),
+                      ("forests", lambda i: codes_fn(X[rows[i]:rows[i] + 1]))):
+        lat = latencies(fn, len(rows))
+        results.add(f"rules.single.{label}.p50_us", np.percentile(lat, 50) * 1e6, "µs")
+        results.add(f"rules.single.{label}.p99_us", np.percentile(lat, 99) * 1e6, "µs")
+
+# Run in a fresh interpreter per measurement, so nothing is already imported.
+# Peak RSS is VmHWM (Linux-only): ru_maxrss would carry over the peak of this
+# benchmark process, which the child inherits through fork and keeps across exec.
+STARTUP_PROBE = """
+import json, sys, time
+sys.path.insert(0, "ml")
+t0 = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t0
+with open("/proc/self/status") as f:
+    hwm_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_mb":  hwm_kb / 1024,
+    "sklearn": "sklearn" in sys.modules,
+}}))
+"""
+
+def bench_startup(results, args):
+    for module in ("predict_server", "train_model"):
+        runs = []
+        for _ in range(args.repeats):
+            t0  = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(module=module)],
+                                 capture_output=True, text=True, check=True).stdout
+            runs.append(dict(json.loads(out.splitlines()[-1]), process=time.perf_counter() - t0))
+
+        # Import time covers model loading for predict_server; process time adds interpreter startup
+        results.add(f"startup.{module}.import_ms", min(r["seconds"] for r in runs) * 1e3, "ms")
+        results.add(f"startup.{module}.process_ms", min(r["process"] for r in runs) * 1e3, "ms")
+        results.add(f"startup.{module}.peak_rss_mb", min(r["rss_mb"] for r in runs), "MB")
+        if module == "predict_server" and runs[0]["sklearn"]:
+            print("  ⚠️  predict_server imported scikit-learn (no flat export, so the pickle was loaded)")
+
+# ── Comparison ────────────────────────────────────────────────────────────────
+def compare(current, baseline, tolerance):
+    """
+    Print every metric present in both runs with its relative change and return
+    the names that got worse by more than `tolerance` (a fraction).
+    """
+    print(f"\n{'═'*88}")
+    print(f"  {'metric':52s}  {'baseline':>10s}  {'current':>10s}  {'change':>8s}")
+    print(f"{'═'*88}")
+    regressions = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None or base["value"] == 0:
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        worse  = change if cur["better"] == "lower" else -change
+        flag   = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  ❌ regression"
+        elif worse < -tolerance:
+            flag = "  ✅ faster" if cur["unit"] not in ("MB", "KB") else "  ✅ smaller"
+        print(f"  {name:52s}  {base['value']:10.3f}  {cur['value']:10.3f}  {change:+8.1%}{flag}")
+
+    missing = sorted(set(baseline) - set(current))
+    if missing:
+        print(f"  ({len(missing)} baseline metrics not measured in this run)")
+    return regressions
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generation, training and serving.")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--out", default=RESULTS_PATH, help="where to write the JSON results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="relative slowdown that counts as a regression (default 0.15)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per timing; the best is kept")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast smoke run")
+    parser.add_argument("--data", default="ml/data/synthetic_profiles.csv", help="training set")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    results = Results()
+    for suite in suites:
+        print(f"⏱  {suite}")
+        t0 = time.perf_counter()
+        globals()[f"bench_{suite}"](results, args)
+        print(f"   ({time.perf_counter() - t0:.1f}s)")
+
+    run = {"format": FORMAT_NAME, "environment": environment(), "suites": suites, "metrics": results.metrics}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"✅ Wrote {len(results.metrics)} metrics → {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("platform") != run["environment"]["platform"]:
+            print("⚠️  Baseline was recorded on a different platform; timings may not be comparable")
+        regressions = compare(results.metrics, baseline["metrics"], args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+ml/calibration.py
+Temperature scaling for the forests' class probabilities.
+
+A forest's soft vote is the share of trees agreeing, which is typically
+over-confident near pure leaves and under-confident in between. One scalar
+temperature T per target reshapes it:
+
+  p_T(c) ∝ (p(c) + EPS) ** (1 / T)
+
+T > 1 flattens, T < 1 sharpens, and the ranking of classes never changes, so
+the predicted label is the same before and after. train_model.py fits T on
+out-of-fold probabilities by minimising negative log-likelihood and stores the
+temperatures in the bundle (and the flat export's manifest); predict_server.py
+applies them to the probabilities it returns.
+
+Only T >= 1 is searched. On targets the forests nearly always get right the
+NLL keeps falling as T shrinks, and a sharpening T turns a 51/49 vote into
+near-certainty, so a confident cell could no longer be told from a coin-flip.
+A fit whose best T sits on either end of the grid found no interior minimum
+and keeps T = 1 (the raw vote).
+
+NumPy only, so the serving path does not need scikit-learn for it.
+"""
+
+import numpy as np
+
+# Floor added before scaling, so classes no tree voted for keep a little mass
+EPS = 1e-3
+
+# Candidate temperatures: a log-spaced grid is enough for a one-parameter fit
+TEMPERATURES = np.geomspace(1.0, 10.0, 61)
+
+def apply(proba, temperature):
+    """Rescale (n, n_classes) probabilities by `temperature`; rows still sum to 1. T = 1 is the raw vote."""
+    proba  = np.asarray(proba, dtype=float)
+    if temperature == 1.0:
+        return proba
+    logits = np.log(proba + EPS) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=1, keepdims=True)
+
+def nll(proba, y):
+    """Mean negative log-likelihood of label codes y under (n, n_classes) probabilities."""
+    p = np.asarray(proba)[np.arange(len(y)), y]
+    return float(-np.log(np.clip(p, 1e-12, 1.0)).mean())
+
+def expected_calibration_error(proba, y, bins=10):
+    """Gap between confidence and accuracy of the top class, averaged over confidence bins."""
+    proba      = np.asarray(proba)
+    confidence = proba.max(axis=1)
+    correct    = proba.argmax(axis=1) == y
+    which      = np.minimum((confidence * bins).astype(int), bins - 1)
+    error = 0.0
+    for b in range(bins):
+        in_bin = which == b
+        if in_bin.any():
+            error += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(error)
+
+def fit_temperature(proba, y):
+    """The grid temperature with the lowest NLL of label codes y; 1.0 when that is a grid edge."""
+    losses = [nll(apply(proba, t), y) for t in TEMPERATURES]
+    best   = int(np.argmin(losses))
+    if best in (0, len(TEMPERATURES) - 1):
+        return 1.0
+    return float(TEMPERATURES[best])
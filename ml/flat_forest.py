@@ -0,0 +1,314 @@
+"""
+ml/flat_forest.py
+Flat, memory-mappable export of the model bundle plus a pure-NumPy evaluator.
+
+Every tree of every forest in the bundle is laid out in one shared node pool:
+
+  feature.npy    int16    split feature per node (0 for leaves)
+  threshold.npy  float64  split threshold per node (go left when x <= threshold)
+  children.npy   int32    (n_nodes, 2) left/right child as global node indices
+                          (leaves point to themselves)
+  value.npy      float64  (n_nodes, max_outputs, max_classes) normalised leaf class distribution
+  roots.npy      int32    root node of each tree
+
+manifest.json records the format version, the bundle version the export was
+made from, the targets and their labels, the bundle's calibration temperatures
+(see calibration.py), and for each forest its tree range, the targets it serves
+and the class code behind every output column.
+
+publish() writes each export to its own ui_model_flat-<version>-*/ directory
+and repoints the ui_model_flat symlink at it with a single rename, so a server
+reloading meanwhile opens the old export or the new one, never a partial one
+or none. The export it replaced is kept (a server may still have it mapped).
+
+The arrays are opened with np.load(mmap_mode='r'), so N server workers share a
+single copy through the page cache and loading takes milliseconds instead of
+unpickling nine forests. Leaves loop back to themselves, so evaluation is
+max_depth rounds of branch-free gathers over all trees at once.
+
+Run:    python3 ml/flat_forest.py            (export an existing pickle bundle)
+Verify: python3 ml/flat_forest.py --verify
+Output: ml/models/ui_model_flat/ (a symlink to the current ml/models/ui_model_flat-<version>-*/)
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+import lookup_table
+from fused import fused_forest
+
+# ── Config ────────────────────────────────────────────────────────────────────
+FLAT_DIR       = "ml/models/ui_model_flat"
+FORMAT_NAME    = "vantage-flat-forest"
+FORMAT_VERSION = 1
+ARRAYS         = ["feature", "threshold", "children", "value", "roots"]
+BLOCK_ROWS     = 256    # rows evaluated per gather, bounds the (rows, trees, outputs, classes) temporary
+
+# ── Export ────────────────────────────────────────────────────────────────────
+def _bundle_forests(bundle):
+    """Group bundle targets by the sklearn forest that serves them: [(forest, {target: output})]."""
+    forests = {}
+    for target in lookup_table.bundle_targets(bundle):
+        model  = bundle["models"][target]
+        forest = fused_forest(model)
+        output = model.output if forest is not None else 0
+        forest = forest if forest is not None else model
+        forests.setdefault(id(forest), (forest, {}))[1][target] = output
+    return list(forests.values())
+
+def export_bundle(bundle, version, out_dir=FLAT_DIR):
+    """Write the bundle's trees as flat arrays plus manifest.json into out_dir."""
+    groups = _bundle_forests(bundle)
+    max_outputs = max(f.n_outputs_ for f, _ in groups)
+    max_classes = max(
+        max(len(c) for c in (f.classes_ if f.n_outputs_ > 1 else [f.classes_]))
+        for f, _ in groups
+    )
+    n_nodes = sum(est.tree_.node_count for f, _ in groups for est in f.estimators_)
+
+    feature   = np.zeros(n_nodes, dtype=np.int16)
+    threshold = np.zeros(n_nodes, dtype=np.float64)
+    children  = np.empty((n_nodes, 2), dtype=np.int32)
+    value     = np.zeros((n_nodes, max_outputs, max_classes), dtype=np.float64)
+    roots     = []
+
+    forests_meta = []
+    offset = 0
+    for forest, outputs in groups:
+        tree_start = len(roots)
+        for est in forest.estimators_:
+            t = est.tree_
+            n = t.node_count
+            ids = np.arange(offset, offset + n, dtype=np.int32)
+            is_leaf = t.children_left < 0
+
+            feature[offset:offset + n]   = np.where(is_leaf, 0, t.feature)
+            threshold[offset:offset + n] = np.where(is_leaf, 0.0, t.threshold)
+            children[offset:offset + n, 0] = np.where(is_leaf, ids, t.children_left + offset)
+            children[offset:offset + n, 1] = np.where(is_leaf, ids, t.children_right + offset)
+
+            v = t.value / t.value.sum(axis=2, keepdims=True)
+            value[offset:offset + n, :v.shape[1], :v.shape[2]] = v
+
+            roots.append(offset)
+            offset += n
+
+        classes = forest.classes_ if forest.n_outputs_ > 1 else [forest.classes_]
+        forests_meta.append({
+            "trees":       [tree_start, len(roots)],
+            "max_depth":   int(max(est.tree_.max_depth for est in forest.estimators_)),
+            "outputs":     outputs,
+            "class_codes": [[int(c) for c in cls] for cls in classes],
+        })
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        "feature": feature, "threshold": threshold, "children": children,
+        "value": value, "roots": np.array(roots, dtype=np.int32),
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+
+    manifest = {
+        "format":              FORMAT_NAME,
+        "format_version":      FORMAT_VERSION,
+        "bundle_version":      version,
+        "feature_cols":        list(bundle["feature_cols"]),
+        "categorical_targets": list(bundle["categorical_targets"]),
+        "binary_targets":      list(bundle["binary_targets"]),
+        "label_classes": {
+            t: [str(c) for c in bundle["encoders"][t].classes_] for t in bundle["categorical_targets"]
+        },
+        "calibration":         dict(bundle.get("calibration") or {}),
+        "forests":             forests_meta,
+    }
+    # Manifest last, so a reader never sees it pointing at half-written arrays
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+# ── Evaluator ─────────────────────────────────────────────────────────────────
+class FlatModel:
+    """Pure-NumPy evaluator over an exported node pool."""
+
+    def __init__(self, manifest, arrays):
+        self.manifest            = manifest
+        self.bundle_version      = manifest["bundle_version"]
+        self.categorical_targets = manifest["categorical_targets"]
+        self.binary_targets      = manifest["binary_targets"]
+        self.targets             = self.categorical_targets + self.binary_targets
+        self.label_classes       = manifest["label_classes"]
+        self.calibration         = manifest.get("calibration", {})
+        self.forests             = manifest["forests"]
+        self.max_depth           = max(f["max_depth"] for f in self.forests)
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def leaves(self, X):
+        """Leaf node reached in every tree: an (n, n_trees) index matrix."""
+        # Same float32 cast sklearn applies before comparing against thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        flat_x   = X.ravel()
+        row_base = (np.arange(n) * n_features)[:, None]
+        children = self.children.reshape(-1)
+
+        node = np.broadcast_to(self.roots, (n, len(self.roots)))
+        for _ in range(self.max_depth):
+            go_right = np.take(flat_x, row_base + np.take(self.feature, node)) > np.take(self.threshold, node)
+            node = np.take(children, node * 2 + go_right)
+        return node
+
+    def predict_proba(self, X):
+        """{target: (n, n_classes) averaged class distribution} — sklearn's soft vote."""
+        X = np.asarray(X)
+        if len(X) == 0:
+            return {t: np.empty((0, self._n_classes(t))) for t in self.targets}
+        blocks = [self._predict_proba_block(X[i:i + BLOCK_ROWS]) for i in range(0, len(X), BLOCK_ROWS)]
+        if len(blocks) == 1:
+            return blocks[0]
+        return {t: np.concatenate([b[t] for b in blocks]) for t in self.targets}
+
+    def _n_classes(self, target):
+        for forest in self.forests:
+            if target in forest["outputs"]:
+                return len(forest["class_codes"][forest["outputs"][target]])
+
+    def _predict_proba_block(self, X):
+        node  = self.leaves(X)
+        proba = {}
+        for forest in self.forests:
+            start, stop = forest["trees"]
+            avg = self.value[node[:, start:stop]].sum(axis=1) / (stop - start)
+            for target, output in forest["outputs"].items():
+                proba[target] = avg[:, output, :len(forest["class_codes"][output])]
+        return proba
+
+    def predict_codes(self, X):
+        """(n, 9) uint8 class codes, matching lookup_table.predict_codes."""
+        return self._codes(self.predict_proba(X), len(X))
+
+    def predict(self, X):
+        """
+        (codes, {target: (n, n_labels) probabilities}) from a single traversal.
+        Probability columns are in class-code order, like lookup_table.predict_proba.
+        """
+        proba = self.predict_proba(X)
+        codes = self._codes(proba, len(X))
+        full  = {}
+        for forest in self.forests:
+            for target, output in forest["outputs"].items():
+                n_labels = len(self.label_classes[target]) if target in self.label_classes else 2
+                full[target] = np.zeros((len(X), n_labels))
+                full[target][:, forest["class_codes"][output]] = proba[target]
+        return codes, full
+
+    def _codes(self, proba, n):
+        codes = np.empty((n, len(self.targets)), dtype=np.uint8)
+        for forest in self.forests:
+            for target, output in forest["outputs"].items():
+                class_codes = np.asarray(forest["class_codes"][output], dtype=np.uint8)
+                codes[:, self.targets.index(target)] = class_codes[proba[target].argmax(axis=1)]
+        return codes
+
+def publish(bundle, version, out_dir=FLAT_DIR):
+    """
+    Export into a fresh versioned directory next to out_dir, then atomically
+    point the out_dir symlink at it. Keeps the export it replaced and removes
+    older ones. Returns the new directory.
+    """
+    parent, name = os.path.split(os.path.abspath(out_dir))
+    target = tempfile.mkdtemp(prefix=f"{name}-{version}-", dir=parent)
+    os.chmod(target, 0o755)
+    export_bundle(bundle, version, target)
+
+    if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+        # A plain directory from before exports were versioned: moved aside once, the only gap
+        previous = os.path.join(parent, f"{name}-unversioned")
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(out_dir, previous)
+    else:
+        previous = os.path.realpath(out_dir) if os.path.islink(out_dir) else None
+
+    link = os.path.join(parent, f".{name}.link")
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)   # relative, so ml/models can be moved as a whole
+    os.replace(link, out_dir)
+
+    keep = {os.path.realpath(target), previous and os.path.realpath(previous)}
+    for stale in glob.glob(os.path.join(parent, f"{name}-*")):
+        if os.path.realpath(stale) not in keep:
+            shutil.rmtree(stale, ignore_errors=True)
+    return target
+
+def exists(path=FLAT_DIR):
+    return os.path.exists(os.path.join(path, "manifest.json"))
+
+def load(path=FLAT_DIR, mmap=True):
+    """Open an export. Arrays are memory-mapped read-only unless mmap=False."""
+    path = os.path.realpath(path)   # resolve the symlink once: manifest and arrays come from one export
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME or manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"unsupported flat model format {manifest.get('format')!r} "
+            f"v{manifest.get('format_version')} (expected {FORMAT_NAME} v{FORMAT_VERSION})"
+        )
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        for name in ARRAYS
+    }
+    return FlatModel(manifest, arrays)
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Export the UI model bundle as flat NumPy arrays.")
+    parser.add_argument("--bundle", default=lookup_table.BUNDLE_PATH)
+    parser.add_argument("--out", default=FLAT_DIR)
+    parser.add_argument("--verify", action="store_true",
+                        help="check an existing export against the live bundle over the whole domain")
+    args = parser.parse_args()
+
+    bundle  = lookup_table.load_bundle(args.bundle)
+    version = lookup_table.bundle_version(args.bundle)
+
+    if not args.verify:
+        publish(bundle, version, args.out)
+        size = sum(os.path.getsize(os.path.join(args.out, f"{n}.npy")) for n in ARRAYS)
+        print(f"✅ Exported {args.out}/  ({size / 1e6:.1f} MB, bundle {version})")
+        return
+
+    model = load(args.out)
+    if model.bundle_version != version:
+        print(f"❌ {args.out} was exported from bundle {model.bundle_version}, not {version}")
+        sys.exit(1)
+
+    X = lookup_table.domain_features()
+    mismatches = 0
+    for start in range(0, len(X), 2048):
+        chunk = X[start:start + 2048]
+        mismatches += int(np.count_nonzero(
+            model.predict_codes(chunk) != lookup_table.predict_codes(bundle, chunk)
+        ))
+    if mismatches:
+        print(f"❌ {mismatches} mismatching predictions over {len(X)} profiles")
+        sys.exit(1)
+
+    # Probabilities on a sample: float sums in a different order, so compare with a tolerance
+    sample = X[np.random.default_rng(0).choice(len(X), 2048, replace=False)]
+    _, flat_proba = model.predict(sample)
+    live_proba    = lookup_table.predict_proba(bundle, sample)
+    worst = max(float(np.abs(flat_proba[t] - live_proba[t]).max()) for t in model.targets)
+    if worst > 1e-9:
+        print(f"❌ Probabilities differ from the bundle by up to {worst:.2e}")
+        sys.exit(1)
+    print(f"✅ Flat export agrees with the bundle on all {len(X)} profiles (and on probabilities)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+ml/fused.py
+Per-target views onto a single multi-output forest.
+
+In fused mode train_model.py fits one RandomForestClassifier over all nine
+targets at once, so trees and splits are shared. The bundle still maps every
+target name to a model with the usual predict / predict_proba / classes_ /
+feature_importances_ surface — each entry is a FusedTargetModel pointing at the
+same forest — so the bundle format and predict_server.py stay unchanged.
+"""
+
+class FusedTargetModel:
+    """One output column of a shared multi-output forest."""
+
+    def __init__(self, forest, output):
+        self.forest = forest
+        self.output = output
+
+    @property
+    def classes_(self):
+        return self.forest.classes_[self.output]
+
+    @property
+    def feature_importances_(self):
+        return self.forest.feature_importances_
+
+    def predict(self, X):
+        return self.forest.predict(X)[:, self.output]
+
+    def predict_proba(self, X):
+        return self.forest.predict_proba(X)[self.output]
+
+def fused_forest(model):
+    """The shared forest behind a FusedTargetModel, or None for a plain model."""
+    return model.forest if isinstance(model, FusedTargetModel) else None
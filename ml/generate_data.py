@@ -3,167 +3,51 @@ generate_data.py
 Generates a synthetic labeled dataset for the Vantage neurodivergent UI config model.
 
 Each row represents a student's CAP profile (inputs) and their optimal UI config (outputs).
-Rules are derived from the neurodivergent_ux_research.md document.
+Rules are derived from the neurodivergent_ux_research.md document and live in rules.py.
 
 Run: python3 ml/generate_data.py
 Output: ml/data/synthetic_profiles.csv
+
+Large datasets use the NumPy-vectorized path, which applies the same rules to
+whole column arrays and writes the CSV in fixed-size chunks (flat memory):
+  python3 ml/generate_data.py --vectorized --n 10000000 --chunk-size 1000000 --seed 7
+  python3 ml/generate_data.py --verify     (vectorized rules == scalar rules; also in ml/test_generate_data.py)
+
+--shards K splits the vectorized run into K shard files generated by a process
+pool. Each shard draws from its own stream spawned from np.random.SeedSequence
+(seed), so the output depends only on (seed, N, K, chunk size) — never on how
+many --workers produce it. A manifest lists the shards, row counts and hashes:
+  python3 ml/generate_data.py --n 10000000 --shards 16 --workers 8
+  python3 ml/generate_data.py --n 2000000 --shards 8 --scaling   (1..cores timing)
+
+An --out ending in .parquet or .feather writes a typed columnar file instead
+(needs pyarrow): int8 flags, the ordinal encodings train_model.py uses
+(support_level_enc, info_density_pref_enc, time_horizon_enc) computed at write
+time, and dictionary-encoded label columns.
+  python3 ml/generate_data.py --n 10000000 --out ml/data/synthetic_profiles.parquet
 """
 
+import argparse
 import random
 import json
 import csv
+import hashlib
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from itertools import combinations
 
-random.seed(42)
+import numpy as np
 
-# ── Disorder definitions ─────────────────────────────────────────────────────
-ALL_DISORDERS = ["adhd", "asd", "dyslexia", "dyscalculia", "dyspraxia", "spd", "anxiety"]
-
-DISORDER_RULES = {
-    "adhd": {
-        "color_theme":    "neutral",
-        "font_family":    "inter",
-        "font_size":      "large",
-        "motion":         "reduced",
-        "info_density":   "minimal",
-        "large_targets":  True,
-        "read_aloud":     True,
-        "progress_bars":  True,
-        "no_timers":      True,
-    },
-    "asd": {
-        "color_theme":    "warm",        # warm oat/beige
-        "font_family":    "atkinson",
-        "font_size":      "default",
-        "motion":         "off",
-        "info_density":   "minimal",
-        "large_targets":  False,
-        "read_aloud":     True,
-        "progress_bars":  True,
-        "no_timers":      True,
-    },
-    "dyslexia": {
-        "color_theme":    "cream",
-        "font_family":    "lexend",
-        "font_size":      "xl",          # 18-20px
-        "motion":         "reduced",
-        "info_density":   "moderate",
-        "large_targets":  False,
-        "read_aloud":     True,          # critical
-        "progress_bars":  True,
-        "no_timers":      False,
-    },
-    "dyscalculia": {
-        "color_theme":    "neutral",
-        "font_family":    "inter",
-        "font_size":      "large",
-        "motion":         "reduced",
-        "info_density":   "minimal",
-        "large_targets":  False,
-        "read_aloud":     True,
-        "progress_bars":  True,          # visual only, no percentages
-        "no_timers":      True,
-    },
-    "dyspraxia": {
-        "color_theme":    "neutral",
-        "font_family":    "atkinson",
-        "font_size":      "large",
-        "motion":         "reduced",
-        "info_density":   "moderate",
-        "large_targets":  True,          # critical
-        "read_aloud":     True,
-        "progress_bars":  True,
-        "no_timers":      False,
-    },
-    "spd": {
-        "color_theme":    "dark",        # low-sensory / dark default
-        "font_family":    "inter",
-        "font_size":      "default",
-        "motion":         "off",         # strict off
-        "info_density":   "minimal",
-        "large_targets":  False,
-        "read_aloud":     False,
-        "progress_bars":  True,
-        "no_timers":      False,
-    },
-    "anxiety": {
-        "color_theme":    "calm",        # cloud / sea-salt blues
-        "font_family":    "nunito",
-        "font_size":      "default",
-        "motion":         "reduced",
-        "info_density":   "moderate",
-        "large_targets":  False,
-        "read_aloud":     False,
-        "progress_bars":  True,
-        "no_timers":      True,
-    },
-}
-
-# Priority rules when disorders conflict
-# Higher number = higher override priority
-PRIORITY = {
-    "motion":         {"off": 3, "reduced": 2, "on": 1},
-    "font_size":      {"xl": 3, "large": 2, "default": 1},
-    "info_density":   {"minimal": 3, "moderate": 2, "full": 1},
-    "color_theme":    {"dark": 2, "cream": 2, "warm": 2, "calm": 2, "neutral": 1},
-    "font_family":    {"lexend": 3, "opendyslexic": 3, "atkinson": 2, "nunito": 2, "inter": 1},
-}
-
-BOOL_OUTPUTS = ["large_targets", "read_aloud", "progress_bars", "no_timers"]
-
-def merge_disorders(disorder_list):
-    """Merge rules from multiple disorders using priority/OR logic."""
-    if not disorder_list:
-        return {
-            "color_theme":   "neutral",
-            "font_family":   "inter",
-            "font_size":     "default",
-            "motion":        "on",
-            "info_density":  "full",
-            "large_targets": False,
-            "read_aloud":    False,
-            "progress_bars": False,
-            "no_timers":     False,
-        }
-
-    result = {}
-    rules = [DISORDER_RULES[d] for d in disorder_list]
-
-    # For priority fields: take highest priority value
-    for field, priority_map in PRIORITY.items():
-        candidates = [r[field] for r in rules]
-        result[field] = max(candidates, key=lambda v: priority_map.get(v, 0))
+from rules import (
+    ALL_DISORDERS, DISORDER_RULES, PRIORITY, BOOL_OUTPUTS, DEFAULT_CONFIG,
+    SUPPORT_LEVELS, DENSITY_PREFS, SENSORY_FLAGS, compute_config,
+)
 
-    # For boolean fields: OR (any disorder needing it = enable it)
-    for field in BOOL_OUTPUTS:
-        result[field] = any(r[field] for r in rules)
-
-    return result
-
-def support_level_adjustments(config, support_level):
-    """Apply support_level overrides (high support = more accessibility)."""
-    if support_level == "high":
-        config["info_density"] = "minimal"
-        config["read_aloud"] = True
-        config["font_size"] = "xl" if config["font_size"] == "default" else config["font_size"]
-    elif support_level == "low":
-        # Don't override anything — user may prefer standard
-        if config["info_density"] == "full":
-            config["info_density"] = "moderate"
-    return config
-
-def sensory_flags_adjustments(config, sensory_flags):
-    """Apply additional sensory flags from CAP profile."""
-    if "light_sensitivity" in sensory_flags:
-        config["color_theme"] = "dark"
-        config["motion"] = "off"
-    if "sound_sensitivity" in sensory_flags:
-        config["read_aloud"] = False
-    if "motion_sensitivity" in sensory_flags:
-        config["motion"] = "off"
-    return config
+random.seed(42)
 
+# ── Labelling ────────────────────────────────────────────────────────────────
+# The deterministic rules live in rules.py; only the noise is specific to generation
 def add_noise(config, noise_level=0.08):
     """Add small random variation to simulate individual differences."""
     if random.random() < noise_level:
@@ -191,15 +75,7 @@ def generate_row():
     sensory_flags = [s for s in sensory_flags if s != "none"]
 
     # Generate optimal UI config
-    config = merge_disorders(disorders)
-    config = support_level_adjustments(config, support_level)
-    config = sensory_flags_adjustments(config, sensory_flags)
-
-    # User's explicit density pref can override if stronger
-    density_pri = PRIORITY["info_density"]
-    if density_pri.get(info_density_pref, 0) > density_pri.get(config["info_density"], 0):
-        config["info_density"] = info_density_pref
-
+    config = compute_config(disorders, support_level, info_density_pref, sensory_flags)
     config = add_noise(config)
 
     return {
@@ -231,13 +107,360 @@ def generate_row():
         "no_timers":         int(config["no_timers"]),
     }
 
+# ── Vectorized generation ─────────────────────────────────────────────────────
+# Categorical fields are carried as integer codes into these vocabularies and
+# only turned back into strings when a chunk is written.
+FIELD_VALUES   = {field: list(priority_map) for field, priority_map in PRIORITY.items()}
+TIME_HORIZONS  = ["24h", "72h", "1week", "2weeks"]
+
+# Column order of generate_row()
+COLUMNS = (
+    [f"has_{d}" for d in ALL_DISORDERS]
+    + ["n_disorders", "support_level", "info_density_pref", "time_horizon"]
+    + SENSORY_FLAGS
+    + ["color_theme", "font_family", "font_size", "motion", "info_density"]
+    + BOOL_OUTPUTS
+)
+
+# Columnar files store the ordinal encodings instead of the raw enum strings
+TYPED_COLUMNS = (
+    [f"has_{d}" for d in ALL_DISORDERS]
+    + ["n_disorders", "support_level_enc", "info_density_pref_enc", "time_horizon_enc"]
+    + SENSORY_FLAGS
+    + ["color_theme", "font_family", "font_size", "motion", "info_density"]
+    + BOOL_OUTPUTS
+)
+
+def _code(field, value):
+    return FIELD_VALUES[field].index(value)
+
+def merge_disorders_vec(has):
+    """
+    merge_disorders over an (n, 7) boolean matrix of disorder flags (ALL_DISORDERS
+    order). Priority ties go to the alphabetically first disorder, exactly as
+    max() does over the sorted disorder list in the scalar path.
+    """
+    any_disorder = has.any(axis=1)
+    tie_break    = np.array([len(ALL_DISORDERS) - sorted(ALL_DISORDERS).index(d) for d in ALL_DISORDERS])
+
+    config = {}
+    for field, priority_map in PRIORITY.items():
+        values = np.array([_code(field, DISORDER_RULES[d][field]) for d in ALL_DISORDERS])
+        score  = np.array([priority_map[DISORDER_RULES[d][field]] for d in ALL_DISORDERS])
+        score  = score * (len(ALL_DISORDERS) + 1) + tie_break
+        winner = np.where(has, score, -1).argmax(axis=1)
+        config[field] = np.where(any_disorder, values[winner], _code(field, DEFAULT_CONFIG[field]))
+
+    for field in BOOL_OUTPUTS:
+        needs = np.array([DISORDER_RULES[d][field] for d in ALL_DISORDERS])
+        config[field] = (has & needs).any(axis=1)
+    return config
+
+def compute_config_vec(has, support, density_pref, sensory):
+    """
+    compute_config over whole columns. `support` and `density_pref` are codes
+    into SUPPORT_LEVELS / DENSITY_PREFS, `sensory` is an (n, 3) boolean matrix
+    in SENSORY_FLAGS order.
+    """
+    config = merge_disorders_vec(has)
+
+    # support_level_adjustments
+    high = support == SUPPORT_LEVELS.index("high")
+    low  = support == SUPPORT_LEVELS.index("low")
+    config["info_density"] = np.where(high, _code("info_density", "minimal"), config["info_density"])
+    config["read_aloud"]   = config["read_aloud"] | high
+    config["font_size"]    = np.where(
+        high & (config["font_size"] == _code("font_size", "default")),
+        _code("font_size", "xl"), config["font_size"],
+    )
+    config["info_density"] = np.where(
+        low & (config["info_density"] == _code("info_density", "full")),
+        _code("info_density", "moderate"), config["info_density"],
+    )
+
+    # sensory_flags_adjustments
+    light, sound, motion = sensory[:, 0], sensory[:, 1], sensory[:, 2]
+    config["color_theme"] = np.where(light, _code("color_theme", "dark"), config["color_theme"])
+    config["motion"]      = np.where(light | motion, _code("motion", "off"), config["motion"])
+    config["read_aloud"]  = config["read_aloud"] & ~sound
+
+    # Explicit density pref overrides when stronger
+    density_pri = np.array([PRIORITY["info_density"][v] for v in FIELD_VALUES["info_density"]])
+    pref_code   = np.array([_code("info_density", v) for v in DENSITY_PREFS])[density_pref]
+    config["info_density"] = np.where(
+        density_pri[pref_code] > density_pri[config["info_density"]], pref_code, config["info_density"]
+    )
+    return config
+
+def _sample_without_replacement(rng, n, n_items, k):
+    """(n, n_items) boolean mask choosing k[i] distinct items per row uniformly."""
+    rank = np.argsort(rng.random((n, n_items)), axis=1).argsort(axis=1)
+    return rank < k[:, None]
+
+def generate_chunk(rng, n, noise_level=0.08, typed=False):
+    """
+    Generate n rows with the same marginals as generate_row(), as a dict of
+    columns. With typed=True the enums are returned as int8 ordinal encodings
+    and the label fields as codes into FIELD_VALUES (see TYPED_COLUMNS).
+    """
+    n_disorders  = rng.choice(4, size=n, p=[0.20, 0.40, 0.30, 0.10])
+    has          = _sample_without_replacement(rng, n, len(ALL_DISORDERS), n_disorders)
+    support      = rng.choice(3, size=n, p=[0.25, 0.45, 0.30])
+    density_pref = rng.choice(3, size=n, p=[0.30, 0.45, 0.25])
+    horizon      = rng.integers(0, len(TIME_HORIZONS), size=n)
+    # Pick 0-2 of the three flags plus "none", then drop "none"
+    sensory      = _sample_without_replacement(rng, n, len(SENSORY_FLAGS) + 1, rng.integers(0, 3, size=n))
+    sensory      = sensory[:, :len(SENSORY_FLAGS)]
+
+    config = compute_config_vec(has, support, density_pref, sensory)
+
+    # add_noise
+    jitter = rng.random((3, n)) < noise_level
+    config["font_size"]  = np.where(jitter[0], rng.integers(0, 3, size=n), config["font_size"])
+    config["motion"]     = np.where(jitter[1], rng.integers(0, 3, size=n), config["motion"])
+    config["read_aloud"] = config["read_aloud"] ^ jitter[2]
+
+    columns = {f"has_{d}": has[:, i].astype(np.int8) for i, d in enumerate(ALL_DISORDERS)}
+    columns["n_disorders"] = has.sum(axis=1).astype(np.int8)
+    for i, flag in enumerate(SENSORY_FLAGS):
+        columns[flag] = sensory[:, i].astype(np.int8)
+    for field in BOOL_OUTPUTS:
+        columns[field] = config[field].astype(np.int8)
+
+    if typed:
+        columns["support_level_enc"]     = support.astype(np.int8)
+        columns["info_density_pref_enc"] = density_pref.astype(np.int8)
+        columns["time_horizon_enc"]      = horizon.astype(np.int8)
+        for field in PRIORITY:
+            columns[field] = config[field].astype(np.int8)
+        return {name: columns[name] for name in TYPED_COLUMNS}
+
+    columns["support_level"]     = np.array(SUPPORT_LEVELS)[support]
+    columns["info_density_pref"] = np.array(DENSITY_PREFS)[density_pref]
+    columns["time_horizon"]      = np.array(TIME_HORIZONS)[horizon]
+    for field in PRIORITY:
+        columns[field] = np.array(FIELD_VALUES[field])[config[field]]
+    return {name: columns[name] for name in COLUMNS}
+
+def output_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return {".parquet": "parquet", ".feather": "feather", ".arrow": "feather"}.get(ext, "csv")
+
+def arrow_chunk(rng, n):
+    """generate_chunk as a pyarrow Table with dictionary-encoded label columns."""
+    import pyarrow as pa
+
+    columns = generate_chunk(rng, n, typed=True)
+    arrays  = {}
+    for name, values in columns.items():
+        if name in PRIORITY:
+            arrays[name] = pa.DictionaryArray.from_arrays(values, pa.array(FIELD_VALUES[name]))
+        else:
+            arrays[name] = pa.array(values)
+    return pa.table(arrays)
+
+class _CsvChunkWriter:
+    def __init__(self, path):
+        import pandas as pd
+        self.pd    = pd
+        self.f     = open(path, "w", newline="")
+        self.first = True
+
+    def write(self, rng, size):
+        self.pd.DataFrame(generate_chunk(rng, size)).to_csv(self.f, header=self.first, index=False)
+        self.first = False
+
+    def close(self):
+        self.f.close()
+
+class _ArrowChunkWriter:
+    """Parquet (one row group per chunk) or Feather v2 (one record batch per chunk)."""
+
+    def __init__(self, path, fmt):
+        self.path, self.fmt, self.writer = path, fmt, None
+
+    def write(self, rng, size):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = arrow_chunk(rng, size)
+        if self.writer is None:
+            if self.fmt == "parquet":
+                self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            else:
+                options = pa.ipc.IpcWriteOptions(compression="lz4")
+                self.writer = pa.ipc.new_file(self.path, table.schema, options=options)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def write_vectorized(out_path, n, chunk_size, seed, progress=True):
+    """
+    Stream n rows to out_path in chunks of chunk_size. `seed` is an int or a
+    np.random.SeedSequence, so the same call always writes the same rows.
+    The format follows the file extension (see output_format).
+    """
+    rng    = np.random.default_rng(seed)
+    fmt    = output_format(out_path)
+    writer = _CsvChunkWriter(out_path) if fmt == "csv" else _ArrowChunkWriter(out_path, fmt)
+
+    written = 0
+    try:
+        while written < n:
+            size = min(chunk_size, n - written)
+            writer.write(rng, size)
+            written += size
+            if progress:
+                print(f"   {written:>12,d} / {n:,d} rows", end="\r", flush=True)
+    finally:
+        writer.close()
+    if progress:
+        print()
+
+# ── Sharded generation ────────────────────────────────────────────────────────
+def shard_paths(out_path, n_shards):
+    stem, ext = os.path.splitext(out_path)
+    return [f"{stem}-{i:05d}-of-{n_shards:05d}{ext}" for i in range(n_shards)], f"{stem}.manifest.json"
+
+def _write_shard(job):
+    path, rows, chunk_size, seed_seq = job
+    write_vectorized(path, rows, chunk_size, seed_seq, progress=False)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def write_sharded(out_path, n, n_shards, chunk_size, seed, workers):
+    """
+    Generate n rows as n_shards files on a process pool and write the manifest.
+    Shard i gets the i-th child of SeedSequence(seed) and a fixed row count, so
+    its contents do not depend on the worker count or scheduling order.
+    """
+    paths, manifest_path = shard_paths(out_path, n_shards)
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    rows  = [n // n_shards + (i < n % n_shards) for i in range(n_shards)]
+    jobs  = [(paths[i], rows[i], chunk_size, seeds[i]) for i in range(n_shards)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        hashes = list(pool.map(_write_shard, jobs))
+
+    manifest = {
+        "seed":       seed,
+        "rows":       n,
+        "chunk_size": chunk_size,
+        "columns":    COLUMNS if output_format(out_path) == "csv" else TYPED_COLUMNS,
+        "shards": [
+            {"path": os.path.basename(p), "rows": r, "spawn_key": list(s.spawn_key), "sha256": h}
+            for p, r, s, h in zip(paths, rows, seeds, hashes)
+        ],
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path, manifest
+
+def scaling_report(out_path, n, n_shards, chunk_size, seed):
+    """Time write_sharded with 1..cpu_count workers and check every run writes identical shards."""
+    max_workers = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, 16, 32, max_workers} & set(range(1, max_workers + 1)))
+
+    print(f"⏱  Sharded generation scaling — {n:,d} rows, {n_shards} shards, {max_workers} cores")
+    baseline = reference = None
+    for workers in counts:
+        t0 = time.perf_counter()
+        _, manifest = write_sharded(out_path, n, n_shards, chunk_size, seed, workers)
+        elapsed = time.perf_counter() - t0
+        hashes = [s["sha256"] for s in manifest["shards"]]
+        reference = reference or hashes
+        baseline  = baseline or elapsed
+        same = "identical" if hashes == reference else "DIFFERENT"
+        print(f"  {workers:3d} workers  {elapsed:8.2f}s  {n / elapsed:12,.0f} rows/s  "
+              f"×{baseline / elapsed:5.2f}  shards {same}")
+
+def verify_vectorized():
+    """
+    Check compute_config_vec against the scalar compute_config over every
+    combination of disorders, support level, density pref and sensory flags.
+    Returns the number of mismatching (profile, field) pairs.
+    """
+    from itertools import product
+
+    rows = list(product(
+        range(1 << len(ALL_DISORDERS)), range(3), range(3), range(1 << len(SENSORY_FLAGS)),
+    ))
+    bits    = np.array([r[0] for r in rows])
+    has     = ((bits[:, None] >> np.arange(len(ALL_DISORDERS))) & 1).astype(bool)
+    support = np.array([r[1] for r in rows])
+    density = np.array([r[2] for r in rows])
+    sbits   = np.array([r[3] for r in rows])
+    sensory = ((sbits[:, None] >> np.arange(len(SENSORY_FLAGS))) & 1).astype(bool)
+
+    vec = compute_config_vec(has, support, density, sensory)
+
+    mismatches = 0
+    for i in range(len(rows)):
+        disorders = sorted(d for j, d in enumerate(ALL_DISORDERS) if has[i, j])
+        flags     = [f for j, f in enumerate(SENSORY_FLAGS) if sensory[i, j]]
+        scalar    = compute_config(disorders, SUPPORT_LEVELS[support[i]], DENSITY_PREFS[density[i]], flags)
+        for field in PRIORITY:
+            mismatches += FIELD_VALUES[field][vec[field][i]] != scalar[field]
+        for field in BOOL_OUTPUTS:
+            mismatches += bool(vec[field][i]) != scalar[field]
+    return len(rows), mismatches
+
 def main():
-    os.makedirs("ml/data", exist_ok=True)
+    parser = argparse.ArgumentParser(description="Generate the synthetic CAP → UI config dataset.")
+    parser.add_argument("--n", type=int, default=2000, help="rows to generate")
+    parser.add_argument("--out", default="ml/data/synthetic_profiles.csv",
+                        help=".csv, or .parquet / .feather for typed columnar output (implies --vectorized)")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="NumPy column-wise generation, written in chunks")
+    parser.add_argument("--chunk-size", type=int, default=500_000, help="rows per chunk (vectorized)")
+    parser.add_argument("--seed", type=int, default=42, help="np.random.Generator seed (vectorized)")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="split the vectorized run into this many shard files (implies --vectorized)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes generating shards in parallel")
+    parser.add_argument("--scaling", action="store_true",
+                        help="report sharded wall-clock time from 1 to all cores")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the vectorized rules against the scalar rules and exit")
+    args = parser.parse_args()
+
+    if args.verify:
+        n_profiles, mismatches = verify_vectorized()
+        if mismatches:
+            raise SystemExit(f"❌ {mismatches} field mismatches over {n_profiles} profiles")
+        print(f"✅ Vectorized rules match the scalar rules on all {n_profiles} profiles")
+        return
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+
+    if args.scaling:
+        scaling_report(args.out, args.n, max(args.shards, 1), args.chunk_size, args.seed)
+        return
+
+    if args.shards:
+        t0 = time.perf_counter()
+        manifest_path, _ = write_sharded(args.out, args.n, args.shards, args.chunk_size, args.seed, args.workers)
+        elapsed = time.perf_counter() - t0
+        print(f"✅ Generated {args.n:,d} rows in {args.shards} shards → {manifest_path}  "
+              f"({elapsed:.1f}s, {args.workers} workers)")
+        return
+
+    if args.vectorized or output_format(args.out) != "csv":
+        t0 = time.perf_counter()
+        write_vectorized(args.out, args.n, args.chunk_size, args.seed)
+        elapsed = time.perf_counter() - t0
+        print(f"✅ Generated {args.n:,d} rows → {args.out}  ({elapsed:.1f}s, {args.n / elapsed:,.0f} rows/s)")
+        return
 
-    N = 2000
+    N = args.n
     rows = [generate_row() for _ in range(N)]
 
-    out_path = "ml/data/synthetic_profiles.csv"
+    out_path = args.out
     with open(out_path, "w", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=rows[0].keys())
         writer.writeheader()
@@ -0,0 +1,227 @@
+"""
+ml/lookup_table.py
+Compiles the trained model bundle into a full-domain lookup table.
+
+The feature vectors cap_to_features can produce form a finite domain: 7 disorder
+bits, 3 sensory bits, 3 support levels, 3 density levels and 4 time horizons
+(n_disorders is derived from the disorder bits) — 36,864 cells in total. Every
+cell is evaluated once against all nine models and the predicted class codes are
+stored as a packed uint8 array, so serving a profile becomes a bit-pack plus an
+array index instead of nine forest walks.
+
+Run:    python3 ml/lookup_table.py            (after train_model.py)
+Verify: python3 ml/lookup_table.py --verify
+Output: ml/models/ui_lookup_table.npz
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import numpy as np
+
+from fused import fused_forest
+
+# ── Config ────────────────────────────────────────────────────────────────────
+BUNDLE_PATH = "ml/models/ui_model_bundle.pkl"
+TABLE_PATH  = "ml/models/ui_lookup_table.npz"
+
+N_DISORDERS = 7
+N_SENSORY   = 3
+N_SUPPORT   = 3
+N_DENSITY   = 3
+N_HORIZON   = 4
+
+N_BITS      = N_DISORDERS + N_SENSORY
+DOMAIN_SIZE = (1 << N_BITS) * N_SUPPORT * N_DENSITY * N_HORIZON
+
+# Column positions inside the 14-wide feature vector (see FEATURE_COLS)
+DISORDER_COLS = slice(0, 7)
+N_DISORDERS_COL = 7
+SENSORY_COLS  = slice(8, 11)
+SUPPORT_COL, DENSITY_COL, HORIZON_COL = 11, 12, 13
+
+# ── Domain indexing ───────────────────────────────────────────────────────────
+def feature_index(X):
+    """
+    Pack feature rows into their lookup-table cell index.
+    Disorder bits occupy bits 0-6 and sensory bits 7-9; the enums are then
+    mixed in as radix digits: ((bits*3 + support)*3 + density)*4 + horizon.
+    """
+    X = np.asarray(X)
+    bits = np.zeros(len(X), dtype=np.int64)
+    for i in range(N_DISORDERS):
+        bits |= X[:, i].astype(np.int64) << i
+    for i in range(N_SENSORY):
+        bits |= X[:, SENSORY_COLS.start + i].astype(np.int64) << (N_DISORDERS + i)
+
+    idx = bits * N_SUPPORT + X[:, SUPPORT_COL].astype(np.int64)
+    idx = idx * N_DENSITY  + X[:, DENSITY_COL].astype(np.int64)
+    idx = idx * N_HORIZON  + X[:, HORIZON_COL].astype(np.int64)
+    return idx
+
+def domain_features():
+    """Every feature vector in the domain, as a (DOMAIN_SIZE, 14) matrix in index order."""
+    return index_features(np.arange(DOMAIN_SIZE, dtype=np.int64))
+
+def index_features(idx):
+    """Inverse of feature_index: the (n, 14) feature rows of lookup-table cell indices."""
+    idx = np.array(idx, dtype=np.int64)
+    horizon = idx % N_HORIZON
+    idx //= N_HORIZON
+    density = idx % N_DENSITY
+    idx //= N_DENSITY
+    support = idx % N_SUPPORT
+    bits    = idx // N_SUPPORT
+
+    X = np.zeros((len(idx), 14), dtype=float)
+    for i in range(N_DISORDERS):
+        X[:, i] = (bits >> i) & 1
+    X[:, N_DISORDERS_COL] = X[:, DISORDER_COLS].sum(axis=1)
+    for i in range(N_SENSORY):
+        X[:, SENSORY_COLS.start + i] = (bits >> (N_DISORDERS + i)) & 1
+    X[:, SUPPORT_COL] = support
+    X[:, DENSITY_COL] = density
+    X[:, HORIZON_COL] = horizon
+    return X
+
+# ── Bundle helpers ────────────────────────────────────────────────────────────
+def bundle_version(path=BUNDLE_PATH):
+    """Content hash of a model bundle, used to tie compiled artefacts to it."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+def load_bundle(path=BUNDLE_PATH):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def bundle_targets(bundle):
+    return list(bundle["categorical_targets"]) + list(bundle["binary_targets"])
+
+def predict_codes(bundle, X):
+    """
+    Run every model in the bundle over X and return an (n, 9) uint8 matrix of
+    class codes — label-encoder indices for categorical targets, 0/1 for binary.
+    A fused multi-output forest is evaluated once and shared by its targets.
+    """
+    models  = bundle["models"]
+    targets = bundle_targets(bundle)
+    codes   = np.empty((len(X), len(targets)), dtype=np.uint8)
+    shared  = {}
+    for j, target in enumerate(targets):
+        model  = models[target]
+        forest = fused_forest(model)
+        if forest is None:
+            codes[:, j] = model.predict(X)
+            continue
+        if id(forest) not in shared:
+            shared[id(forest)] = forest.predict(X)
+        codes[:, j] = shared[id(forest)][:, model.output]
+    return codes
+
+def n_labels(bundle, target):
+    return len(bundle["encoders"][target].classes_) if target in bundle["encoders"] else 2
+
+def predict_proba(bundle, X):
+    """
+    {target: (n, n_labels) class probabilities} for X, columns in class-code
+    order (the label-encoder order, or False/True). Each forest is evaluated
+    once; a class the forest never saw in training gets probability 0.
+    """
+    models = bundle["models"]
+    shared = {}
+    proba  = {}
+    for target in bundle_targets(bundle):
+        model  = models[target]
+        forest = fused_forest(model)
+        if forest is None:
+            p, classes = model.predict_proba(X), model.classes_
+        else:
+            if id(forest) not in shared:
+                shared[id(forest)] = forest.predict_proba(X)
+            p, classes = shared[id(forest)][model.output], forest.classes_[model.output]
+        full = np.zeros((len(X), n_labels(bundle, target)))
+        full[:, np.asarray(classes, dtype=np.int64)] = p
+        proba[target] = full
+    return proba
+
+# ── Compile / load / verify ───────────────────────────────────────────────────
+def compile_table(bundle, chunk_size=8192):
+    """Evaluate the bundle over the whole domain, in chunks to bound memory."""
+    X = domain_features()
+    codes = np.empty((DOMAIN_SIZE, len(bundle_targets(bundle))), dtype=np.uint8)
+    for start in range(0, DOMAIN_SIZE, chunk_size):
+        codes[start:start + chunk_size] = predict_codes(bundle, X[start:start + chunk_size])
+    return codes
+
+def save_table(codes, targets, version, path=TABLE_PATH):
+    np.savez(path, codes=codes, targets=np.array(targets), bundle_version=np.array(version))
+
+def load_table(path=TABLE_PATH, version=None):
+    """
+    Load a compiled table. Returns None when the file is missing or was compiled
+    from a different bundle than `version`, so callers fall back to the forests.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        if version is not None and str(data["bundle_version"]) != version:
+            return None
+        return data["codes"]
+
+def verify(bundle, codes):
+    """
+    Check that the table agrees with the live bundle on every cell, and that
+    feature_index is a bijection over the domain. Returns the mismatch count.
+    """
+    X = domain_features()
+    idx = feature_index(X)
+    if not np.array_equal(idx, np.arange(DOMAIN_SIZE)):
+        print("❌ feature_index does not round-trip domain_features")
+        return DOMAIN_SIZE
+
+    mismatches = 0
+    for j, target in enumerate(bundle_targets(bundle)):
+        live = bundle["models"][target].predict(X).astype(np.uint8)
+        bad = int(np.count_nonzero(codes[idx, j] != live))
+        mismatches += bad
+        status = "✅" if bad == 0 else "❌"
+        print(f"  {status} {target:16s}  {DOMAIN_SIZE - bad}/{DOMAIN_SIZE} cells agree")
+    return mismatches
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Compile the UI model bundle into a lookup table.")
+    parser.add_argument("--bundle", default=BUNDLE_PATH)
+    parser.add_argument("--out", default=TABLE_PATH)
+    parser.add_argument("--verify", action="store_true",
+                        help="check an existing table against the live bundle instead of compiling")
+    args = parser.parse_args()
+
+    bundle  = load_bundle(args.bundle)
+    version = bundle_version(args.bundle)
+
+    if args.verify:
+        codes = load_table(args.out, version)
+        if codes is None:
+            print(f"❌ {args.out} is missing or was compiled from a different bundle")
+            sys.exit(1)
+        print(f"🔎 Verifying {args.out} against bundle {version} ({DOMAIN_SIZE} cells)")
+        mismatches = verify(bundle, codes)
+        if mismatches:
+            print(f"❌ {mismatches} mismatching cells")
+            sys.exit(1)
+        print("✅ Table agrees with the bundle on every cell")
+        return
+
+    print(f"⚙️  Compiling {DOMAIN_SIZE} cells × {len(bundle_targets(bundle))} targets...")
+    codes = compile_table(bundle)
+    save_table(codes, bundle_targets(bundle), version, args.out)
+    print(f"✅ Saved {args.out}  ({codes.nbytes / 1024:.0f} KiB, bundle {version})")
+
+if __name__ == "__main__":
+    main()
@@ -3,94 +3,809 @@ ml/predict_server.py
 Flask microserver that loads the trained UI config model bundle and serves predictions.
 Run: python3 ml/predict_server.py
 Listens on: http://localhost:5001
+(development server — see ml/serve.py for the multi-worker and async modes)
+
+Models are read from the flat export in ml/models/ui_model_flat/ when present
+(memory-mapped, shared between workers, no unpickling — see flat_forest.py);
+otherwise the pickle bundle is loaded. Serving from the flat export needs only
+NumPy and Flask at runtime; scikit-learn is needed only for the pickle
+fallback (python3 ml/bench.py --suites startup tracks import time and memory).
+
+If ml/models/ui_lookup_table.npz was compiled from the loaded bundle
+(python3 ml/lookup_table.py), /predict answers from the table instead of
+walking the forests.
+
+POST /predict_batch takes {"cap_profiles": [...]} and streams one
+{"ui_config": ...} JSON line per profile, in input order.
+
+Both accept two options next to the profile(s):
+  "probabilities": true  adds {"probabilities": {target: {label: p}}} (binary
+                         targets: the probability of true), calibrated with
+                         the bundle's per-target temperatures (calibration.py)
+  "top_k": k (1-10)      adds {"alternatives": [{"ui_config", "probability"}]},
+                         up to k most likely whole configs, best first
+Both come from the same forest traversal as the prediction itself. The lookup
+table, cache and rules hold no probabilities, so these requests always walk
+the forests (rules mode returns the rule's answer with probability 1).
+
+Profiles are validated strictly (see encode_caps for the accepted values).
+A body that is not a JSON object, or bad options, get 400 {"error"}; invalid
+profile fields get 422 {"error", "details": [{"field", "message", "value"}]}
+("index" added per profile in batches), instead of silently falling back to
+defaults. A valid profile is packed into one int, its lookup-table cell,
+which is what the table, rules, cache and forests are all indexed by.
+
+/predict responses carry a strong ETag built from the profile key, the bundle
+version and the options, which together fix the body, and
+  Cache-Control: private, max-age=VANTAGE_HTTP_MAX_AGE (default 300),
+                 stale-while-revalidate=VANTAGE_HTTP_STALE (default 86400)
+A request whose If-None-Match holds the current ETag gets 304 without a model
+call, so a client can revalidate a cached config for the price of validating
+the profile. A reload changes the version and so every ETag. Both serve.py
+modes keep client connections alive; this development server closes each one.
+
+Without a table, forest results are cached per profile key
+(see prediction_cache.py):
+  VANTAGE_CACHE_SIZE  in-process LRU entries (default 4096, 0 disables)
+  VANTAGE_CACHE_DB    optional SQLite path shared by all workers on the host
+
+VANTAGE_PREDICTOR picks what answers (see rules.py for the rule engine):
+  model   the forests only (table / cache / model as above)
+  rules   the deterministic labelling rules only — needs no model files
+  hybrid  the rules, except on the cells where the loaded model's prediction
+          differs from them; those go through the model path, so responses
+          are identical to model mode. The disagreeing cells are read off the
+          lookup table, or found at startup by evaluating the whole domain
+          (~25 s on one core) when there is none.
+  auto    hybrid with a lookup table, model without one, rules when there are
+          no model files at all (default)
+
+GET /metrics serves request and error counts, per-stage timing histograms
+(parse, features, predict by source, decode, serialize) and the model load
+time in Prometheus text format (see metrics.py):
+  VANTAGE_METRICS       0 turns every counter and timer into a no-op (default 1)
+  VANTAGE_PROFILE_RATE  fraction of requests run under cProfile (default 0)
+  VANTAGE_PROFILE_OUT   merged profile, written every 20 samples and at exit
+                        (default ml/models/server.prof)
+
+The model is hot-reloadable. A new bundle is loaded next to the active one,
+checked on SANITY_CAPS (it must agree with the labelling rules on at least
+VANTAGE_RELOAD_MIN_AGREEMENT of the fields, default 0.8), then swapped in with
+a single reference assignment. Requests already running finish on the model
+they started with. Reloads are triggered by
+  POST /admin/reload    (Bearer VANTAGE_ADMIN_TOKEN, or loopback only when unset)
+  a file watcher        polls the model files every VANTAGE_RELOAD_POLL seconds
+                        (default 2, 0 disables) and reloads once a change has
+                        settled for one interval; it runs under serve.py and
+                        when this file is run directly
 """
 
+import atexit
+import hmac
+import os
 import pickle
 import json
+import threading
+import time
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+import calibration
+import flat_forest
+import lookup_table
+import metrics
+import rules
+from prediction_cache import PredictionCache
 
 app = Flask(__name__)
 
-# ── Load model bundle ─────────────────────────────────────────────────────────
-with open("ml/models/ui_model_bundle.pkl", "rb") as f:
-    BUNDLE = pickle.load(f)
+# ── Model state ───────────────────────────────────────────────────────────────
+BUNDLE_PATH = "ml/models/ui_model_bundle.pkl"
+FLAT_DIR    = "ml/models/ui_model_flat"
+TABLE_PATH  = "ml/models/ui_lookup_table.npz"
+
+PREDICTORS = ("auto", "model", "rules", "hybrid")
+PREDICTOR_SETTING = os.environ.get("VANTAGE_PREDICTOR", "auto")
+if PREDICTOR_SETTING not in PREDICTORS:
+    raise ValueError(f"VANTAGE_PREDICTOR must be one of {', '.join(PREDICTORS)}, not {PREDICTOR_SETTING!r}")
+
+class ModelState:
+    """
+    Everything one loaded model needs to answer requests. A reload builds a new
+    ModelState and swaps STATE; a request reads STATE once and uses that object
+    throughout, so it never mixes two models.
+    """
+
+    def __init__(self, predictor, version, categorical_targets, binary_targets, labels,
+                 flat=None, bundle=None, temperatures=None):
+        self.predictor           = predictor
+        self.version             = version
+        self.categorical_targets = list(categorical_targets)
+        self.binary_targets      = list(binary_targets)
+        self.labels              = labels
+        self.flat                = flat
+        self.bundle              = bundle
+        self.temperatures        = dict(temperatures or {})
+        self.table               = None
+        self.rule_codes          = None
+        self.overrides           = None
+        self.signature           = None
+        self.load_seconds        = None
+        self.loaded_at           = None
+
+    @property
+    def n_targets(self):
+        return len(self.categorical_targets) + len(self.binary_targets)
+
+    @property
+    def has_model(self):
+        return self.flat is not None or self.bundle is not None
+
+    def n_labels(self, target):
+        return len(self.labels[target]) if target in self.labels else 2
+
+def model_signature():
+    """(path, mtime, size) of every model file, to tell when they change on disk."""
+    sig = []
+    for path in (os.path.join(FLAT_DIR, "manifest.json"), BUNDLE_PATH, TABLE_PATH):
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+def load_state(setting=PREDICTOR_SETTING):
+    """Load the model files into a new ModelState (the active one is untouched)."""
+    t0        = time.perf_counter()
+    signature = model_signature()
+    predictor = setting
+
+    if setting != "rules" and flat_forest.exists(FLAT_DIR):
+        flat  = flat_forest.load(FLAT_DIR)
+        state = ModelState(predictor, flat.bundle_version, flat.categorical_targets, flat.binary_targets,
+                           flat.label_classes, flat=flat, temperatures=flat.calibration)
+    elif setting != "rules" and (setting != "auto" or os.path.exists(BUNDLE_PATH)):
+        try:
+            with open(BUNDLE_PATH, "rb") as f:
+                bundle = pickle.load(f)
+        except ModuleNotFoundError as e:
+            raise RuntimeError(
+                f"{BUNDLE_PATH} needs {e.name} to unpickle; install it or export the "
+                f"NumPy-only flat model with python3 ml/flat_forest.py"
+            ) from e
+        labels = {t: [str(c) for c in bundle["encoders"][t].classes_] for t in bundle["categorical_targets"]}
+        state  = ModelState(predictor, lookup_table.bundle_version(BUNDLE_PATH), bundle["categorical_targets"],
+                            bundle["binary_targets"], labels, bundle=bundle,
+                            temperatures=bundle.get("calibration"))
+    else:
+        # No model files: the rules answer everything, labels encoded like LabelEncoder would
+        categorical = ["color_theme", "font_family", "font_size", "motion", "info_density"]
+        state = ModelState("rules", f"rules-{rules.RULES_VERSION}", categorical, rules.BOOL_OUTPUTS,
+                           {t: sorted(rules.PRIORITY[t]) for t in categorical})
+
+    if state.predictor != "rules":
+        state.table = lookup_table.load_table(TABLE_PATH, state.version)
+    if state.predictor == "auto":
+        # Without the table, finding the disagreeing cells means walking the forests over the whole domain
+        state.predictor = "hybrid" if state.table is not None else "model"
+
+    if state.predictor != "model":
+        state.rule_codes = compile_rule_codes(state)
+    if state.predictor == "hybrid":
+        state.overrides = compile_overrides(state)
 
-MODELS             = BUNDLE["models"]
-ENCODERS           = BUNDLE["encoders"]
-FEATURE_COLS       = BUNDLE["feature_cols"]
-CATEGORICAL_TARGETS = BUNDLE["categorical_targets"]
-BINARY_TARGETS     = BUNDLE["binary_targets"]
+    state.signature    = signature
+    state.load_seconds = time.perf_counter() - t0
+    state.loaded_at    = time.time()
+    return state
 
+# ── Profiles ──────────────────────────────────────────────────────────────────
+# A CAP profile is validated once and packed into a single int: its lookup-table
+# cell index (see lookup_table.feature_index). That key is the model input (the
+# table and rule codes are indexed by it, and key_features expands it for the
+# forests), the cache key, and the row of every batch array.
 SUPPORT_MAP  = {"low": 0, "reminder": 0, "medium": 1, "step-by-step": 1, "high": 2, "full-agent": 2}
 DENSITY_MAP  = {"minimal": 0, "summary": 0, "moderate": 1, "full": 2}
 HORIZON_MAP  = {"24h": 0, "72h": 1, "1week": 2, "2weeks": 3}
+DEFAULTS     = {"support_level": "medium", "information_density": "moderate", "time_horizon": "1week"}
+
+DISORDERS    = ["adhd", "asd", "dyslexia", "dyscalculia", "dyspraxia", "spd", "anxiety"]
+DISORDER_BIT = {d: 1 << i for i, d in enumerate(DISORDERS)}
+# Bits 0-2 of the sensory mask; crowds and open are valid CAP flags the model has no input for
+SENSORY_BIT  = {
+    "bright": 1, "light_sensitivity": 1,
+    "loud":   2, "sound_sensitivity": 2,
+    "motion_sensitivity": 4,
+    "crowds": 0, "open": 0,
+}
+
+ENUM_FIELDS = {"support_level": SUPPORT_MAP, "information_density": DENSITY_MAP, "time_horizon": HORIZON_MAP}
+LIST_FIELDS = {"disorders": DISORDER_BIT, "sensory_flags": SENSORY_BIT}
+# The onboarding flow keeps the profile in camelCase (lib/cap/engine.js)
+FIELD_ALIASES = {
+    "supportLevel": "support_level", "informationDensity": "information_density",
+    "timeHorizon": "time_horizon", "sensoryFlags": "sensory_flags",
+}
+MAX_ERROR_DETAILS = 50
+
+class RequestError(ValueError):
+    """A malformed request; answered with `status` and {"error", "details"?} JSON."""
+    status = 400
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details or []
+
+    def payload(self):
+        body = {"error": str(self)}
+        if self.details:
+            body["details"] = self.details[:MAX_ERROR_DETAILS]
+        return body
+
+class ProfileError(RequestError):
+    """CAP profile fields that fail validation, one {"field", "message", "value"} detail each."""
+    status = 422
+
+def _field(cap, name):
+    value = cap.get(name)
+    if value is None:
+        for alias, field in FIELD_ALIASES.items():
+            if field == name:
+                value = cap.get(alias)
+    return value
+
+def profile_problems(cap):
+    """(key, []) for a valid CAP profile dict, else (None, [problem details])."""
+    if not isinstance(cap, dict):
+        return None, [{"field": "cap_profile", "message": "must be an object", "value": cap}]
+
+    problems = []
+    enums    = []
+    for name, allowed in ENUM_FIELDS.items():
+        value = _field(cap, name)
+        if value is None:
+            value = DEFAULTS[name]
+        code = allowed.get(value) if isinstance(value, str) else None
+        if code is None:
+            problems.append({"field": name, "message": f"must be one of {', '.join(allowed)}", "value": value})
+        enums.append(code)
+
+    masks = []
+    for name, bits in LIST_FIELDS.items():
+        values = _field(cap, name)
+        mask   = 0
+        if values is not None and not isinstance(values, list):
+            problems.append({"field": name, "message": "must be a list", "value": values})
+            values = None
+        for value in values or ():
+            bit = bits.get(value) if isinstance(value, str) else None
+            if bit is None:
+                problems.append({"field": name, "message": f"entries must be one of {', '.join(bits)}",
+                                 "value": value})
+            else:
+                mask |= bit
+        masks.append(mask)
+
+    if problems:
+        return None, problems
+    support, density, horizon = enums
+    disorder_mask, sensory_mask = masks
+    bits = disorder_mask | sensory_mask << lookup_table.N_DISORDERS
+    return ((bits * lookup_table.N_SUPPORT + support) * lookup_table.N_DENSITY + density) \
+        * lookup_table.N_HORIZON + horizon, []
+
+def encode_cap(cap):
+    """Validate a CAP profile and pack it into its profile key; raises ProfileError."""
+    key, problems = profile_problems(cap)
+    if problems:
+        raise ProfileError("invalid cap_profile", problems)
+    return key
+
+def encode_caps(caps):
+    """
+    Profile keys for a list of CAP profiles, as an int64 array. Every profile is
+    checked; a ProfileError lists the problems of all of them, by index.
+    CAP fields (snake_case, or the onboarding flow's camelCase):
+      - support_level      : reminder | step-by-step | full-agent   (or low | medium | high)
+      - information_density: summary | moderate | full             (or minimal)
+      - time_horizon       : 24h | 72h | 1week | 2weeks
+      - sensory_flags      : list of loud | bright | crowds | open  (crowds / open are not model inputs)
+      - disorders          : optional list of adhd | asd | dyslexia | dyscalculia | dyspraxia | spd | anxiety
+    Missing or null fields take the defaults in DEFAULTS; other keys are ignored.
+    """
+    keys     = np.empty(len(caps), dtype=np.int64)
+    problems = []
+    for i, cap in enumerate(caps):
+        key, found = profile_problems(cap)
+        if found:
+            problems.extend(dict(p, index=i) for p in found)
+        else:
+            keys[i] = key
+    if problems:
+        raise ProfileError("invalid cap_profiles", problems)
+    return keys
+
+def key_features(keys):
+    """(n, 14) model feature rows for profile keys."""
+    return lookup_table.index_features(keys)
 
 def cap_to_features(cap):
+    """Map one CAP profile dict to the model's (1, 14) feature matrix (validated like encode_cap)."""
+    return key_features([encode_cap(cap)])
+
+def caps_to_features(caps):
+    """Map a list of CAP profiles to an (n, 14) feature matrix (validated like encode_caps)."""
+    return key_features(encode_caps(caps))
+
+def model_codes(X, state):
+    """(n, 9) class codes straight from the forests."""
+    if state.flat is not None:
+        return state.flat.predict_codes(X)
+    return lookup_table.predict_codes(state.bundle, X)
+
+def model_matrix(keys, state):
+    """
+    (n, 9) class codes from the model for profile keys. The lookup table answers
+    directly when it is loaded (it already holds every profile); otherwise cached
+    keys are reused and only the misses go through the forests, in one call.
+    """
+    if state.table is not None:
+        with PREDICTS.time("table"):
+            return state.table[keys]
+    if CACHE is None:
+        with PREDICTS.time("model"):
+            return model_codes(key_features(keys), state)
+
+    codes   = np.empty((len(keys), state.n_targets), dtype=np.uint8)
+    missing = []
+    with PREDICTS.time("cache"):
+        for i, key in enumerate(keys.tolist()):
+            cached = CACHE.get(key, state.version)
+            if cached is None:
+                missing.append(i)
+            else:
+                codes[i] = np.frombuffer(cached, dtype=np.uint8)
+
+    if missing:
+        with PREDICTS.time("model"):
+            computed = model_codes(key_features(keys[missing]), state)
+        for i, row in zip(missing, computed):
+            codes[i] = row
+            CACHE.put(int(keys[i]), row.tobytes(), state.version)
+    return codes
+
+# ── Rule engine ───────────────────────────────────────────────────────────────
+def compile_rule_codes(state):
     """
-    Map a CAP profile dict to the model's feature vector.
-    CAP fields from Supabase:
-      - support_level     : reminder | step-by-step | full-agent
-      - information_density: summary | moderate | full
-      - time_horizon      : 24h | 72h | 1week | 2weeks
-      - sensory_flags     : list of loud | bright | crowds | open
-      - disorders         : optional list of adhd | asd | dyslexia | dyscalculia | dyspraxia | spd | anxiety
-    """
-    sensory = cap.get("sensory_flags", []) or []
-    disorders = cap.get("disorders", []) or []
-
-    # Infer sensory signals from CAP flags
-    light_sensitivity  = int("bright" in sensory or "light_sensitivity" in sensory)
-    sound_sensitivity  = int("loud"   in sensory or "sound_sensitivity"  in sensory)
-    motion_sensitivity = int("motion_sensitivity" in sensory)
-
-    # Disorder flags
-    has_adhd        = int("adhd"        in disorders)
-    has_asd         = int("asd"         in disorders)
-    has_dyslexia    = int("dyslexia"    in disorders)
-    has_dyscalculia = int("dyscalculia" in disorders)
-    has_dyspraxia   = int("dyspraxia"   in disorders)
-    has_spd         = int("spd"         in disorders)
-    has_anxiety     = int("anxiety"     in disorders)
-    n_disorders     = sum([has_adhd, has_asd, has_dyslexia, has_dyscalculia,
-                           has_dyspraxia, has_spd, has_anxiety])
-
-    support_enc = SUPPORT_MAP.get(str(cap.get("support_level", "medium")), 1)
-    density_enc = DENSITY_MAP.get(str(cap.get("information_density", "moderate")), 1)
-    horizon_enc = HORIZON_MAP.get(str(cap.get("time_horizon", "1week")), 2)
-
-    return np.array([[
-        has_adhd, has_asd, has_dyslexia, has_dyscalculia,
-        has_dyspraxia, has_spd, has_anxiety, n_disorders,
-        light_sensitivity, sound_sensitivity, motion_sensitivity,
-        support_enc, density_enc, horizon_enc,
-    ]], dtype=float)
+    The rule engine's answer for every lookup-table cell, as (DOMAIN_SIZE, 9)
+    class codes in the state's label encoding. A rule label the model was never
+    trained on is coded 255, which no model prediction can equal.
+    """
+    targets = state.categorical_targets + state.binary_targets
+    configs = rules.compiled()
+    cells   = np.empty((len(configs), len(targets)), dtype=np.uint8)
+    for j, target in enumerate(targets):
+        if target in state.labels:
+            index = {label: code for code, label in enumerate(state.labels[target])}
+            cells[:, j] = [index.get(config[target], 255) for config in configs]
+        else:
+            cells[:, j] = [config[target] for config in configs]
+
+    # Unpack lookup-table indices (see lookup_table.feature_index); the horizon is not a rule input
+    idx     = np.arange(lookup_table.DOMAIN_SIZE, dtype=np.int64) // lookup_table.N_HORIZON
+    density = idx % lookup_table.N_DENSITY
+    idx   //= lookup_table.N_DENSITY
+    support = idx % lookup_table.N_SUPPORT
+    bits    = idx // lookup_table.N_SUPPORT
+    disorder_mask = bits & ((1 << lookup_table.N_DISORDERS) - 1)
+    sensory_mask  = bits >> lookup_table.N_DISORDERS
+    return cells[rules.rule_index(disorder_mask, support, density, sensory_mask)]
+
+def compile_overrides(state, chunk_size=8192):
+    """Cells where the model disagrees with the rules on any target: hybrid mode sends these to the model."""
+    if state.table is not None:
+        model = state.table
+    else:
+        X = lookup_table.domain_features()
+        model = np.concatenate([
+            model_codes(X[start:start + chunk_size], state) for start in range(0, len(X), chunk_size)
+        ])
+    return (model != state.rule_codes).any(axis=1)
+
+def predict_matrix(keys, state=None):
+    """(n, 9) class codes for profile keys from the state's predictor (default: the active one)."""
+    state = state or STATE
+    if state.predictor == "model":
+        return model_matrix(keys, state)
+    with PREDICTS.time("rules"):
+        codes = state.rule_codes[keys]
+    if state.predictor == "hybrid":
+        override = state.overrides[keys]
+        if override.any():
+            codes[override] = model_matrix(keys[override], state)
+    return codes
+
+def decode_codes(codes, state=None):
+    """Turn one row of lookup-table class codes back into a ui_config dict."""
+    state  = state or STATE
+    result = {}
+    for j, target in enumerate(state.categorical_targets):
+        result[target] = state.labels[target][codes[j]]
+    for j, target in enumerate(state.binary_targets, start=len(state.categorical_targets)):
+        result[target] = bool(codes[j])
+    return result
+
+# ── Probabilities ─────────────────────────────────────────────────────────────
+TOP_K_MAX = 10
+
+def prediction_options(data):
+    """(probabilities, top_k) requested in a /predict or /predict_batch body."""
+    probabilities = data.get("probabilities", False)
+    top_k         = data.get("top_k", 0)
+    if not isinstance(probabilities, bool):
+        raise RequestError("probabilities must be true or false")
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 0 <= top_k <= TOP_K_MAX:
+        raise RequestError(f"top_k must be an integer from 0 to {TOP_K_MAX}")
+    return probabilities, top_k
+
+def proba_matrix(keys, state):
+    """
+    (codes, {target: (n, n_labels) calibrated probabilities}) for profile keys,
+    both from one forest traversal, so the codes are always each row's most
+    probable labels. Without a model the rules answer with probability 1.
+    """
+    targets = state.categorical_targets + state.binary_targets
+    if not state.has_model:
+        with PREDICTS.time("rules"):
+            codes = state.rule_codes[keys]
+        return codes, {t: np.eye(state.n_labels(t))[codes[:, j]] for j, t in enumerate(targets)}
+
+    with PREDICTS.time("proba"):
+        X = key_features(keys)
+        if state.flat is not None:
+            codes, proba = state.flat.predict(X)
+        else:
+            proba = lookup_table.predict_proba(state.bundle, X)
+            codes = np.column_stack([proba[t].argmax(axis=1) for t in targets]).astype(np.uint8)
+        for target, temperature in state.temperatures.items():
+            proba[target] = calibration.apply(proba[target], temperature)
+    return codes, proba
+
+def top_configs(proba, j, k, state):
+    """
+    The k most likely whole ui_configs for row j, treating targets as
+    independent: a beam over targets keeping the k best partial configs.
+    """
+    beams = [(0.0, [])]
+    for target in state.categorical_targets + state.binary_targets:
+        p = proba[target][j]
+        candidates = [
+            (score + np.log(p[c]), codes + [c]) for score, codes in beams for c in np.flatnonzero(p > 0)
+        ]
+        beams = sorted(candidates, key=lambda b: -b[0])[:k]
+    return [
+        {"ui_config": decode_codes(codes, state), "probability": round(float(np.exp(score)), 4)}
+        for score, codes in beams
+    ]
+
+def response_bodies(keys, state, probabilities=False, top_k=0):
+    """Response body per profile key: {"ui_config"} plus any requested probabilities / alternatives."""
+    if not (probabilities or top_k):
+        with STAGES.time("predict"):
+            codes = predict_matrix(keys, state)
+        with STAGES.time("decode"):
+            return [{"ui_config": decode_codes(row, state)} for row in codes]
+
+    with STAGES.time("predict"):
+        codes, proba = proba_matrix(keys, state)
+    with STAGES.time("decode"):
+        bodies = [{"ui_config": decode_codes(row, state)} for row in codes]
+        for j, body in enumerate(bodies):
+            if probabilities:
+                body["probabilities"] = {
+                    t: {label: round(float(p), 4) for label, p in zip(state.labels[t], proba[t][j])}
+                    for t in state.categorical_targets
+                }
+                body["probabilities"].update(
+                    {t: round(float(proba[t][j, 1]), 4) for t in state.binary_targets}
+                )
+            if top_k:
+                body["alternatives"] = top_configs(proba, j, top_k, state)
+    return bodies
+
+# ── HTTP caching ──────────────────────────────────────────────────────────────
+HTTP_MAX_AGE = int(os.environ.get("VANTAGE_HTTP_MAX_AGE", "300"))
+HTTP_STALE   = int(os.environ.get("VANTAGE_HTTP_STALE", "86400"))
+
+def response_etag(key, state, probabilities=False, top_k=0):
+    """Strong ETag of a /predict body: profile key, bundle version and options determine it."""
+    options = ("-p" if probabilities else "") + (f"-k{top_k}" if top_k else "")
+    return f'"{state.version}-{key:x}{options}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers `etag` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def cache_headers(etag):
+    return {
+        "ETag":          etag,
+        "Cache-Control": f"private, max-age={HTTP_MAX_AGE}, stale-while-revalidate={HTTP_STALE}",
+    }
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+METRICS = metrics.Registry(enabled=os.environ.get("VANTAGE_METRICS", "1") != "0")
+
+REQUESTS = METRICS.counter(
+    "vantage_requests_total", "Prediction requests by endpoint and HTTP status.", ["endpoint", "status"])
+ERRORS = METRICS.counter(
+    "vantage_errors_total", "Failed prediction requests by endpoint and exception type.", ["endpoint", "type"])
+STAGES = METRICS.histogram(
+    "vantage_stage_seconds", "Time spent in each request stage.", ["stage"])
+PREDICTS = METRICS.histogram(
+    "vantage_predict_seconds",
+    "Time spent producing class codes, by source (table, rules, cache, model, proba).",
+    ["source"])
+BATCH_SIZES = METRICS.histogram(
+    "vantage_batch_profiles", "Profiles per /predict_batch request.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+LOAD_SECONDS = METRICS.gauge(
+    "vantage_model_load_seconds", "Time spent loading the active model, lookup table and rules.")
+RELOADS = METRICS.counter(
+    "vantage_reloads_total", "Model reload attempts by outcome (reloaded, unchanged, rejected).", ["result"])
+CACHE_EVENTS = METRICS.gauge(
+    "vantage_cache_events", "Prediction cache lookups since startup, by outcome.", ["event"])
+CACHE_ENTRIES = METRICS.gauge(
+    "vantage_cache_entries", "Feature vectors held in the in-process prediction cache.")
+
+@METRICS.on_collect
+def collect_cache():
+    if CACHE is None:
+        return
+    stats = CACHE.stats()
+    for event in ("hits", "misses", "evictions", "disk_hits", "disk_misses"):
+        CACHE_EVENTS.set(stats[event], event)
+    CACHE_ENTRIES.set(stats["size"])
+
+PROFILER = metrics.SamplingProfiler(
+    float(os.environ.get("VANTAGE_PROFILE_RATE", "0")),
+    os.environ.get("VANTAGE_PROFILE_OUT", "ml/models/server.prof"),
+)
+if PROFILER.enabled:
+    atexit.register(PROFILER.dump)
+
+# ── Load ──────────────────────────────────────────────────────────────────────
+STATE = load_state()
+
+CACHE_SIZE = int(os.environ.get("VANTAGE_CACHE_SIZE", "4096"))
+CACHE_DB   = os.environ.get("VANTAGE_CACHE_DB") or None
+CACHE      = PredictionCache(STATE.version, CACHE_SIZE, CACHE_DB) if CACHE_SIZE > 0 else None
+
+LOAD_SECONDS.set(STATE.load_seconds)
+
+# ── Hot reload ────────────────────────────────────────────────────────────────
+# Profiles every candidate model must answer sensibly before it is swapped in;
+# the first is the dyslexia example train_model.py ends with
+SANITY_CAPS = [
+    {"disorders": ["dyslexia"], "support_level": "full-agent", "information_density": "summary",
+     "sensory_flags": ["bright"], "time_horizon": "1week"},
+    {},
+    {"disorders": ["adhd"], "support_level": "step-by-step"},
+    {"disorders": ["asd", "spd"], "sensory_flags": ["loud"], "time_horizon": "24h"},
+    {"disorders": ["anxiety", "dyscalculia"], "support_level": "reminder", "information_density": "full"},
+    {"disorders": ["dyspraxia"], "sensory_flags": ["motion_sensitivity"], "time_horizon": "2weeks"},
+]
+RELOAD_MIN_AGREEMENT = float(os.environ.get("VANTAGE_RELOAD_MIN_AGREEMENT", "0.8"))
+RELOAD_POLL          = float(os.environ.get("VANTAGE_RELOAD_POLL", "2"))
+ADMIN_TOKEN          = os.environ.get("VANTAGE_ADMIN_TOKEN") or None
+
+_RELOAD_LOCK = threading.Lock()
+_WATCHER     = None
+LAST_RELOAD  = {"status": None, "at": None, "error": None}
+
+def validate_state(state):
+    """
+    Raise ValueError unless the state's model answers SANITY_CAPS with valid
+    labels that agree with the labelling rules on at least RELOAD_MIN_AGREEMENT
+    of the fields. The model itself is checked, not the hybrid front of it.
+    """
+    keys  = encode_caps(SANITY_CAPS)
+    X     = key_features(keys)
+    codes = model_codes(X, state) if state.has_model else predict_matrix(keys, state)
+    if codes.shape != (len(X), state.n_targets):
+        raise ValueError(f"sanity predictions have shape {codes.shape}, expected {(len(X), state.n_targets)}")
+
+    agree = total = 0
+    for x, row in zip(X.astype(int), codes):
+        config   = decode_codes(row, state)
+        expected = rules.lookup(
+            int((x[0:7] << np.arange(7)).sum()), x[11], x[12], int((x[8:11] << np.arange(3)).sum()),
+        )
+        agree += sum(config[t] == expected[t] for t in config)
+        total += len(config)
+    if agree / total < RELOAD_MIN_AGREEMENT:
+        raise ValueError(
+            f"sanity profiles agree with the rules on {agree}/{total} fields "
+            f"(needs {RELOAD_MIN_AGREEMENT:.0%})"
+        )
+
+def reload_model(force=False):
+    """
+    Load the model files into a new state, validate it and swap it in. The
+    active model keeps serving throughout. Without force, nothing is loaded
+    when the files are unchanged. Returns a status dict.
+    """
+    global STATE
+    with _RELOAD_LOCK:
+        current = STATE
+        try:
+            if model_signature() == current.signature and not force:
+                result = {"status": "unchanged", "bundle_version": current.version}
+            else:
+                # Same version with new files still swaps: e.g. the lookup table was compiled since
+                candidate = load_state()
+                validate_state(candidate)
+                STATE = candidate
+                if CACHE is not None:
+                    CACHE.set_version(candidate.version)
+                LOAD_SECONDS.set(candidate.load_seconds)
+                result = {
+                    "status":           "reloaded",
+                    "bundle_version":   candidate.version,
+                    "previous_version": current.version,
+                    "load_seconds":     round(candidate.load_seconds, 4),
+                }
+        except Exception as e:
+            result = {"status": "rejected", "bundle_version": current.version, "error": f"{type(e).__name__}: {e}"}
+
+        RELOADS.inc(result["status"])
+        LAST_RELOAD.update(status=result["status"], at=time.time(), error=result.get("error"))
+        return result
+
+def watch_models(poll=RELOAD_POLL):
+    """Reload whenever the model files change and then stay unchanged for one poll interval."""
+    pending = rejected = None
+    while True:
+        time.sleep(poll)
+        signature = model_signature()
+        if signature in (STATE.signature, rejected):
+            pending = None
+            continue
+        if signature != pending:
+            # Still being written (retrain.py replaces the pickle, export and table in turn)
+            pending = signature
+            continue
+        pending = None
+        result  = reload_model()
+        if result["status"] == "unchanged":
+            continue
+        print(f"🔄 Model files changed — {result['status']}: {result['bundle_version']}"
+              + (f" ({result['error']})" if "error" in result else ""))
+        # Do not retry the same broken files every interval
+        rejected = signature if result["status"] == "rejected" else None
+
+def start_watcher():
+    """Start the model file watcher in this process (no-op when disabled or already running)."""
+    global _WATCHER
+    if RELOAD_POLL <= 0 or (_WATCHER is not None and _WATCHER.is_alive()):
+        return
+    _WATCHER = threading.Thread(target=watch_models, name="model-watcher", daemon=True)
+    _WATCHER.start()
+
+def admin_allowed(headers, remote_addr):
+    if ADMIN_TOKEN is None:
+        return remote_addr in ("127.0.0.1", "::1")
+    return hmac.compare_digest(headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}")
+
+def request_body():
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        raise RequestError("request body must be a JSON object")
+    return data
+
+def bad_request(endpoint, e):
+    REQUESTS.inc(endpoint, str(e.status))
+    return jsonify(e.payload()), e.status
+
+def error_response(endpoint, e):
+    ERRORS.inc(endpoint, type(e).__name__)
+    REQUESTS.inc(endpoint, "500")
+    return jsonify({"error": str(e)}), 500
 
 @app.route("/predict", methods=["POST"])
 def predict():
-    try:
-        data = request.get_json(force=True)
-        cap  = data.get("cap_profile", {})
-        x    = cap_to_features(cap)
+    with PROFILER.maybe():
+        try:
+            state = STATE
+            with STAGES.time("parse"):
+                data = request_body()
+                cap  = data.get("cap_profile", {})
+                probabilities, top_k = prediction_options(data)
+            with STAGES.time("features"):
+                key = encode_cap(cap)
+            etag = response_etag(key, state, probabilities, top_k)
+            if etag_matches(request.headers.get("If-None-Match"), etag):
+                REQUESTS.inc("predict", "304")
+                return Response(status=304, headers=cache_headers(etag))
+            body = response_bodies(np.array([key]), state, probabilities, top_k)[0]
+            with STAGES.time("serialize"):
+                response = jsonify(body)
+                response.headers.update(cache_headers(etag))
+
+        except RequestError as e:
+            return bad_request("predict", e)
+        except Exception as e:
+            return error_response("predict", e)
+
+    REQUESTS.inc("predict", "200")
+    return response
 
-        result = {}
-        for target in CATEGORICAL_TARGETS:
-            enc      = ENCODERS[target]
-            pred_idx = MODELS[target].predict(x)[0]
-            result[target] = enc.inverse_transform([pred_idx])[0]
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    with PROFILER.maybe():
+        try:
+            state = STATE
+            with STAGES.time("parse"):
+                data = request_body()
+                caps = data.get("cap_profiles", [])
+                probabilities, top_k = prediction_options(data)
+            if not isinstance(caps, list):
+                raise RequestError("cap_profiles must be a list")
+            BATCH_SIZES.observe(len(caps))
+            with STAGES.time("features"):
+                keys = encode_caps(caps)
+            bodies = response_bodies(keys, state, probabilities, top_k)
 
-        for target in BINARY_TARGETS:
-            result[target] = bool(MODELS[target].predict(x)[0])
+        except RequestError as e:
+            return bad_request("predict_batch", e)
+        except Exception as e:
+            return error_response("predict_batch", e)
 
-        return jsonify({"ui_config": result})
+    def generate():
+        # Streamed after the view returns, so serialization is timed across the whole body
+        with STAGES.time("serialize"):
+            for body in bodies:
+                yield json.dumps(body) + "\n"
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    REQUESTS.inc("predict_batch", "200")
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def health_payload():
+    state = STATE
+    return {
+        "status": "ok",
+        "model": "neurodivergent_ui_v1",
+        "bundle_version": state.version,
+        "predictor": state.predictor,
+        "rule_overrides": int(state.overrides.sum()) if state.overrides is not None else None,
+        "flat_model": state.flat is not None,
+        "lookup_table": state.table is not None,
+        "cache": CACHE.stats() if CACHE is not None else None,
+        "model_load_seconds": round(state.load_seconds, 4),
+        "model_loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(state.loaded_at)),
+        "last_reload": LAST_RELOAD,
+    }
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "model": "neurodivergent_ui_v1"})
+    return jsonify(health_payload())
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(METRICS.render(), mimetype=metrics.Registry.CONTENT_TYPE)
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    if not admin_allowed(request.headers, request.remote_addr):
+        return jsonify({"error": "unauthorized"}), 401
+    result = reload_model(force=request.args.get("force") == "1")
+    return jsonify(result), 409 if result["status"] == "rejected" else 200
 
 if __name__ == "__main__":
+    start_watcher()
     print("🧠 Vantage UI Config Model Server — http://localhost:5001")
     app.run(host="0.0.0.0", port=5001, debug=False)
@@ -0,0 +1,129 @@
+"""
+ml/prediction_cache.py
+Per-profile prediction cache for predict_server.py.
+
+Most students map onto a handful of distinct profiles, so the nine class codes
+for a profile are cached after the first model evaluation. Keys are the packed
+profile keys predict_server.encode_caps returns (ints below 36,864), and every
+entry is tied to the model bundle version: when a different bundle is loaded
+the cache empties itself, and the on-disk tier drops rows written for other
+versions.
+Callers pass the version they computed with to get/put, so a request still
+running on the previous model after a hot reload neither reads nor writes
+entries for the new one.
+
+  memory  bounded LRU (OrderedDict) per process
+  disk    optional SQLite file (WAL mode) shared by every worker on the host
+
+Configured from predict_server.py via VANTAGE_CACHE_SIZE and VANTAGE_CACHE_DB.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class PredictionCache:
+    """Bounded LRU of profile key -> class-code bytes, with an optional SQLite tier."""
+
+    def __init__(self, version, maxsize=4096, db_path=None):
+        self.version  = version
+        self.maxsize  = maxsize
+        self.db_path  = db_path
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+        self._local   = threading.local()
+        self.hits = self.misses = self.evictions = 0
+        self.disk_hits = self.disk_misses = 0
+
+        if db_path:
+            db = self._db()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " version TEXT NOT NULL, key INTEGER NOT NULL, codes BLOB NOT NULL,"
+                " PRIMARY KEY (version, key))"
+            )
+            db.execute("DELETE FROM predictions WHERE version != ?", (version,))
+
+    def set_version(self, version):
+        """Switch to a new bundle version, dropping everything cached for the old one."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+        if self.db_path:
+            self._db().execute("DELETE FROM predictions WHERE version != ?", (version,))
+
+    def _db(self):
+        # sqlite3 connections are per-thread and must not cross a fork (gunicorn
+        # preloads in the master), so each worker thread opens its own
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db  = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key, version=None):
+        """Cached codes for a profile key, or None (always None for another bundle version)."""
+        with self._lock:
+            if version is not None and version != self.version:
+                return None
+            codes = self._entries.get(key)
+            if codes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return codes
+            self.misses += 1
+
+        if not self.db_path:
+            return None
+        row = self._db().execute(
+            "SELECT codes FROM predictions WHERE version = ? AND key = ?", (self.version, key)
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, row[0])
+        return row[0]
+
+    def put(self, key, codes, version=None):
+        if version is not None and version != self.version:
+            return
+        self._remember(key, codes)
+        if self.db_path:
+            try:
+                self._db().execute(
+                    "INSERT OR IGNORE INTO predictions (version, key, codes) VALUES (?, ?, ?)",
+                    (self.version, key, codes),
+                )
+            except sqlite3.OperationalError:
+                # Another worker holds the write lock; the memory tier still has it
+                pass
+
+    def _remember(self, key, codes):
+        with self._lock:
+            self._entries[key] = codes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version":     self.version,
+                "size":        len(self._entries),
+                "maxsize":     self.maxsize,
+                "hits":        self.hits,
+                "misses":      self.misses,
+                "evictions":   self.evictions,
+                "disk":        bool(self.db_path),
+                "disk_hits":   self.disk_hits,
+                "disk_misses": self.disk_misses,
+            }
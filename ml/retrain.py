@@ -0,0 +1,278 @@
+"""
+ml/retrain.py
+Incremental retraining from labelled feedback rows (e.g. the UI configs
+students actually keep after manual overrides), without a full rebuild.
+
+  1. New rows are appended to an append-only dataset log (same columns as
+     synthetic_profiles.csv).
+  2. Log rows the current bundle has not learned from yet are compared, per
+     target, against the label distribution the bundle was trained on
+     (total variation distance).
+  3. Forests whose targets drifted past --threshold are warm-started with
+     --add-trees extra trees fitted on base data + log, feedback rows
+     weighted by --feedback-weight. A target whose feedback contains a label
+     the model has never seen cannot be warm-started (the class set is fixed
+     per forest) and is refit from scratch. Other forests are kept as is.
+  4. The new bundle is written atomically (temp file + os.replace) next to a
+     versioned copy in ml/models/history/, then the flat export (a versioned
+     directory behind a symlink, see flat_forest.publish), lookup table and
+     model_metadata.json are regenerated from it. A running server keeps its
+     old model until it reloads. Calibration temperatures are carried over
+     from the parent bundle (there is no out-of-fold data to refit them on):
+     the metadata marks a refit target's temperature stale until a full
+     train_model.py run refits it.
+
+Run:  python3 ml/retrain.py --feedback new_rows.csv [--threshold 0.1] [--add-trees 25]
+      python3 ml/retrain.py                 (re-check rows already in the log)
+Requires: a trained bundle (run train_model.py first)
+"""
+
+import argparse
+import json
+import math
+import os
+import pickle
+import shutil
+import numpy as np
+
+import flat_forest
+import lookup_table
+import train_model
+from fused import FusedTargetModel, fused_forest
+
+# ── Config ────────────────────────────────────────────────────────────────────
+LOG_PATH      = "ml/data/feedback_log.csv"
+HISTORY_DIR   = "ml/models/history"
+METADATA_PATH = "ml/models/model_metadata.json"
+
+DRIFT_THRESHOLD = 0.10   # total variation distance that triggers a refit
+MIN_ROWS        = 50     # pending rows needed before drift is judged at all
+FEEDBACK_WEIGHT = 5.0    # sample weight of a feedback row relative to a synthetic one
+ADD_TREES_SHARE = 0.25   # default --add-trees, as a share of the forest's current size
+
+# ── Dataset log ───────────────────────────────────────────────────────────────
+def append_to_log(feedback_path, log_path=LOG_PATH):
+    """Append a CSV of labelled rows to the log. Returns the number of rows added."""
+    import pandas as pd
+    rows = pd.read_csv(feedback_path)
+    missing = [c for c in _log_columns() if c not in rows.columns]
+    if missing:
+        raise ValueError(f"{feedback_path} is missing columns: {', '.join(missing)}")
+    rows = rows[_log_columns()]
+    rows.to_csv(log_path, mode="a", index=False, header=not os.path.exists(log_path))
+    return len(rows)
+
+def _log_columns():
+    raw = [c for c in train_model.FEATURE_COLS if not c.endswith("_enc")]
+    return raw + ["support_level", "info_density_pref", "time_horizon"] + train_model.ALL_TARGETS
+
+def read_log(log_path=LOG_PATH):
+    import pandas as pd
+    if not os.path.exists(log_path):
+        return pd.DataFrame(columns=train_model.FEATURE_COLS + train_model.ALL_TARGETS)
+    return train_model.read_dataset(log_path)
+
+# ── Drift ─────────────────────────────────────────────────────────────────────
+def label_distribution(values):
+    import pandas as pd
+    counts = pd.Series(values).astype(str).value_counts(normalize=True)
+    return counts.to_dict()
+
+def tv_distance(p, q):
+    """Total variation distance between two {label: probability} dicts."""
+    return 0.5 * sum(abs(p.get(k, 0.0) - q.get(k, 0.0)) for k in set(p) | set(q))
+
+def drift_report(trained, pending):
+    """{target: tv distance} of the pending rows against what the bundle was trained on."""
+    return {
+        t: tv_distance(label_distribution(trained[t]), label_distribution(pending[t]))
+        for t in train_model.ALL_TARGETS
+    }
+
+# ── Refit ─────────────────────────────────────────────────────────────────────
+def bundle_forests(bundle):
+    """[(forest, [targets])] — a fused bundle has one forest serving every target."""
+    groups = {}
+    for target in lookup_table.bundle_targets(bundle):
+        model  = bundle["models"][target]
+        forest = fused_forest(model) or model
+        groups.setdefault(id(forest), (forest, []))[1].append(target)
+    return list(groups.values())
+
+def refit_forest(forest, targets, data, weights, encoders, add_trees):
+    """
+    Grow `forest` by add_trees warm-started trees on `data`, or refit it from
+    scratch when the data holds a label its encoder has never seen. Returns
+    (forest, encoders, how).
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder
+    unseen = [
+        t for t in targets
+        if t in encoders and not set(data[t].astype(str)) <= set(encoders[t].classes_)
+    ]
+    encoders = dict(encoders)
+    if unseen:
+        for t in unseen:
+            encoders[t] = LabelEncoder().fit(data[t].astype(str))
+
+    Y = np.column_stack([
+        encoders[t].transform(data[t].astype(str)) if t in encoders else data[t].values.astype(int) for t in targets
+    ])
+    Y = Y[:, 0] if len(targets) == 1 else Y
+    X = data[train_model.FEATURE_COLS].values
+
+    if unseen:
+        fresh = RandomForestClassifier(**forest.get_params())
+        fresh.set_params(warm_start=False)
+        fresh.fit(X, Y, sample_weight=weights)
+        return fresh, encoders, f"full refit (new labels in {', '.join(unseen)})"
+
+    forest.set_params(warm_start=True, n_estimators=forest.n_estimators + add_trees)
+    forest.fit(X, Y, sample_weight=weights)
+    forest.set_params(warm_start=False)
+    return forest, encoders, f"+{add_trees} trees (now {forest.n_estimators})"
+
+# ── Atomic artefact writes ────────────────────────────────────────────────────
+def write_bundle(bundle, path=lookup_table.BUNDLE_PATH):
+    """Write the bundle via temp file + os.replace and keep a versioned copy. Returns the version."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(bundle, f)
+        f.flush()
+        os.fsync(f.fileno())
+    version = lookup_table.bundle_version(tmp)
+
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    shutil.copyfile(tmp, os.path.join(HISTORY_DIR, f"ui_model_bundle-{version}.pkl"))
+    os.replace(tmp, path)
+    return version
+
+def write_flat(bundle, version, out_dir=flat_forest.FLAT_DIR):
+    """Export to a versioned directory and swap the symlink (flat_forest.publish)."""
+    flat_forest.publish(bundle, version, out_dir)
+
+def write_table(bundle, version, path=lookup_table.TABLE_PATH):
+    codes = flat_forest.load(flat_forest.FLAT_DIR).predict_codes(lookup_table.domain_features())
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        lookup_table.save_table(codes, lookup_table.bundle_targets(bundle), version, f)
+    os.replace(tmp, path)
+
+def write_metadata(bundle, version, refits, x_row, path=METADATA_PATH):
+    """
+    Update model_metadata.json for the new bundle. Refit targets get their
+    forest's params and latency re-measured; their calibration entry keeps only
+    the temperature still applied, marked stale, since it and its NLL / ECE
+    scores were fitted on the old forest.
+    """
+    metadata = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata = json.load(f)
+    metadata["label_classes"] = {
+        t: [str(c) for c in bundle["encoders"][t].classes_] for t in bundle["categorical_targets"]
+    }
+
+    models      = metadata.setdefault("models", {})
+    fitted      = metadata.setdefault("calibration", {})
+    temperature = bundle.get("calibration") or {}
+    for target in refits:
+        model  = bundle["models"][target]
+        params = (fused_forest(model) or model).get_params()
+        models[target] = {
+            "params":     {n: int(params[n]) for n in train_model.SEARCH_GRID},
+            "predict_ms": round(train_model.predict_latency_ms(model.predict, x_row), 4),
+        }
+        if target in temperature:
+            fitted[target] = {
+                "temperature": temperature[target],
+                "stale":       True,
+            }
+    flat = flat_forest.load(flat_forest.FLAT_DIR)
+    metadata["flat_predict_ms"] = round(train_model.predict_latency_ms(flat.predict_codes, x_row), 4)
+
+    metadata["incremental"] = {
+        "bundle_version": version,
+        "parent_version": bundle.get("parent_version"),
+        "feedback_rows":  bundle["feedback_rows"],
+        "refits":         refits,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp, path)
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Incrementally retrain the bundle from feedback rows.")
+    parser.add_argument("--feedback", help="CSV of labelled rows to append to the log first")
+    parser.add_argument("--log", default=LOG_PATH, help="append-only dataset log")
+    parser.add_argument("--data", default=train_model.DATA_PATH, help="base training set")
+    parser.add_argument("--threshold", type=float, default=DRIFT_THRESHOLD,
+                        help="total variation distance that triggers a refit")
+    parser.add_argument("--min-rows", type=int, default=MIN_ROWS,
+                        help="pending log rows needed before drift is judged")
+    parser.add_argument("--add-trees", type=int, default=None,
+                        help=f"trees added per warm start (default {ADD_TREES_SHARE:.0%} of the forest)")
+    parser.add_argument("--feedback-weight", type=float, default=FEEDBACK_WEIGHT)
+    parser.add_argument("--force", action="store_true", help="refit every forest regardless of drift")
+    parser.add_argument("--no-table", action="store_true", help="skip recompiling the lookup table")
+    args = parser.parse_args()
+
+    if args.feedback:
+        added = append_to_log(args.feedback, args.log)
+        print(f"📥 Appended {added} rows → {args.log}")
+
+    bundle  = lookup_table.load_bundle()
+    parent  = lookup_table.bundle_version()
+    learned = bundle.get("feedback_rows", 0)
+
+    base = train_model.read_dataset(args.data)
+    log  = read_log(args.log)
+    pending = log.iloc[learned:]
+    print(f"📂 {len(base)} base rows, {len(log)} log rows ({len(pending)} not yet learned), bundle {parent}")
+
+    if len(pending) < args.min_rows and not args.force:
+        print(f"✅ Waiting for {args.min_rows} pending rows before judging drift — bundle unchanged")
+        return
+
+    trained = pd.concat([base, log.iloc[:learned]], ignore_index=True)
+    drift   = drift_report(trained, pending) if len(pending) else {t: 0.0 for t in train_model.ALL_TARGETS}
+    print(f"\n  {'target':22s}  {'tv distance':>11s}")
+    for target, d in drift.items():
+        print(f"  {target:22s}  {d:11.4f}{'  ← drifted' if d > args.threshold else ''}")
+
+    data    = pd.concat([base, log], ignore_index=True)
+    weights = np.concatenate([np.ones(len(base)), np.full(len(log), args.feedback_weight)])
+
+    encoders = dict(bundle["encoders"])
+    models   = dict(bundle["models"])
+    refits   = {}
+    for forest, targets in bundle_forests(bundle):
+        if not args.force and all(drift[t] <= args.threshold for t in targets):
+            continue
+        add = args.add_trees or max(1, math.ceil(forest.n_estimators * ADD_TREES_SHARE))
+        forest, encoders, how = refit_forest(forest, targets, data, weights, encoders, add)
+        for j, target in enumerate(targets):
+            models[target] = FusedTargetModel(forest, j) if len(targets) > 1 else forest
+            refits[target] = how
+        print(f"🔧 {', '.join(targets)}: {how}")
+
+    if not refits:
+        print("✅ No target drifted past the threshold — bundle unchanged")
+        return
+
+    bundle = dict(bundle, models=models, encoders=encoders,
+                  feedback_rows=len(log), parent_version=parent)
+    version = write_bundle(bundle)
+    write_flat(bundle, version)
+    if not args.no_table:
+        write_table(bundle, version)
+    write_metadata(bundle, version, refits, data[train_model.FEATURE_COLS].values[:1])
+    print(f"✅ Bundle {parent} → {version}  ({len(refits)} targets refit, "
+          f"copy in {HISTORY_DIR}/)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+ml/rules.py
+The deterministic CAP profile → UI config rules, shared by generate_data.py
+(which labels the synthetic dataset with them) and predict_server.py (which can
+answer from them directly).
+
+Only the standard library is used, so the rules load even where NumPy and
+scikit-learn are not installed.
+
+The rule inputs form a small finite domain: 7 disorder bits, 3 support levels,
+3 density prefs and 3 sensory bits — 9,216 cells. compile_rules() evaluates
+compute_config once per cell; lookup() then answers a profile with one
+integer index:
+
+  rule_index = ((disorder_mask*3 + support)*3 + density)*8 + sensory_mask
+
+Disorder bits follow ALL_DISORDERS order and sensory bits SENSORY_FLAGS order.
+Support and density are codes into SUPPORT_LEVELS / DENSITY_PREFS, the same
+ordinal encodings train_model.py uses. The time horizon does not affect the rules.
+"""
+
+import hashlib
+import json
+
+# ── Disorder definitions ─────────────────────────────────────────────────────
+ALL_DISORDERS = ["adhd", "asd", "dyslexia", "dyscalculia", "dyspraxia", "spd", "anxiety"]
+
+DISORDER_RULES = {
+    "adhd": {
+        "color_theme":    "neutral",
+        "font_family":    "inter",
+        "font_size":      "large",
+        "motion":         "reduced",
+        "info_density":   "minimal",
+        "large_targets":  True,
+        "read_aloud":     True,
+        "progress_bars":  True,
+        "no_timers":      True,
+    },
+    "asd": {
+        "color_theme":    "warm",        # warm oat/beige
+        "font_family":    "atkinson",
+        "font_size":      "default",
+        "motion":         "off",
+        "info_density":   "minimal",
+        "large_targets":  False,
+        "read_aloud":     True,
+        "progress_bars":  True,
+        "no_timers":      True,
+    },
+    "dyslexia": {
+        "color_theme":    "cream",
+        "font_family":    "lexend",
+        "font_size":      "xl",          # 18-20px
+        "motion":         "reduced",
+        "info_density":   "moderate",
+        "large_targets":  False,
+        "read_aloud":     True,          # critical
+        "progress_bars":  True,
+        "no_timers":      False,
+    },
+    "dyscalculia": {
+        "color_theme":    "neutral",
+        "font_family":    "inter",
+        "font_size":      "large",
+        "motion":         "reduced",
+        "info_density":   "minimal",
+        "large_targets":  False,
+        "read_aloud":     True,
+        "progress_bars":  True,          # visual only, no percentages
+        "no_timers":      True,
+    },
+    "dyspraxia": {
+        "color_theme":    "neutral",
+        "font_family":    "atkinson",
+        "font_size":      "large",
+        "motion":         "reduced",
+        "info_density":   "moderate",
+        "large_targets":  True,          # critical
+        "read_aloud":     True,
+        "progress_bars":  True,
+        "no_timers":      False,
+    },
+    "spd": {
+        "color_theme":    "dark",        # low-sensory / dark default
+        "font_family":    "inter",
+        "font_size":      "default",
+        "motion":         "off",         # strict off
+        "info_density":   "minimal",
+        "large_targets":  False,
+        "read_aloud":     False,
+        "progress_bars":  True,
+        "no_timers":      False,
+    },
+    "anxiety": {
+        "color_theme":    "calm",        # cloud / sea-salt blues
+        "font_family":    "nunito",
+        "font_size":      "default",
+        "motion":         "reduced",
+        "info_density":   "moderate",
+        "large_targets":  False,
+        "read_aloud":     False,
+        "progress_bars":  True,
+        "no_timers":      True,
+    },
+}
+
+# Priority rules when disorders conflict
+# Higher number = higher override priority
+PRIORITY = {
+    "motion":         {"off": 3, "reduced": 2, "on": 1},
+    "font_size":      {"xl": 3, "large": 2, "default": 1},
+    "info_density":   {"minimal": 3, "moderate": 2, "full": 1},
+    "color_theme":    {"dark": 2, "cream": 2, "warm": 2, "calm": 2, "neutral": 1},
+    "font_family":    {"lexend": 3, "opendyslexic": 3, "atkinson": 2, "nunito": 2, "inter": 1},
+}
+
+BOOL_OUTPUTS = ["large_targets", "read_aloud", "progress_bars", "no_timers"]
+
+# UI config for a student with no listed disorders
+DEFAULT_CONFIG = {
+    "color_theme":   "neutral",
+    "font_family":   "inter",
+    "font_size":     "default",
+    "motion":        "on",
+    "info_density":  "full",
+    "large_targets": False,
+    "read_aloud":    False,
+    "progress_bars": False,
+    "no_timers":     False,
+}
+
+# Input vocabularies, in ordinal-encoding order
+SUPPORT_LEVELS = ["low", "medium", "high"]
+DENSITY_PREFS  = ["minimal", "moderate", "full"]
+SENSORY_FLAGS  = ["light_sensitivity", "sound_sensitivity", "motion_sensitivity"]
+
+# ── Rules ─────────────────────────────────────────────────────────────────────
+def merge_disorders(disorder_list):
+    """Merge rules from multiple disorders using priority/OR logic."""
+    if not disorder_list:
+        return dict(DEFAULT_CONFIG)
+
+    result = {}
+    rules = [DISORDER_RULES[d] for d in disorder_list]
+
+    # For priority fields: take highest priority value
+    for field, priority_map in PRIORITY.items():
+        candidates = [r[field] for r in rules]
+        result[field] = max(candidates, key=lambda v: priority_map.get(v, 0))
+
+    # For boolean fields: OR (any disorder needing it = enable it)
+    for field in BOOL_OUTPUTS:
+        result[field] = any(r[field] for r in rules)
+
+    return result
+
+def support_level_adjustments(config, support_level):
+    """Apply support_level overrides (high support = more accessibility)."""
+    if support_level == "high":
+        config["info_density"] = "minimal"
+        config["read_aloud"] = True
+        config["font_size"] = "xl" if config["font_size"] == "default" else config["font_size"]
+    elif support_level == "low":
+        # Don't override anything — user may prefer standard
+        if config["info_density"] == "full":
+            config["info_density"] = "moderate"
+    return config
+
+def sensory_flags_adjustments(config, sensory_flags):
+    """Apply additional sensory flags from CAP profile."""
+    if "light_sensitivity" in sensory_flags:
+        config["color_theme"] = "dark"
+        config["motion"] = "off"
+    if "sound_sensitivity" in sensory_flags:
+        config["read_aloud"] = False
+    if "motion_sensitivity" in sensory_flags:
+        config["motion"] = "off"
+    return config
+
+def compute_config(disorders, support_level, info_density_pref, sensory_flags):
+    """Noise-free UI config for one profile: the deterministic labelling rules."""
+    return _adjust_config(merge_disorders(disorders), support_level, info_density_pref, sensory_flags)
+
+def _adjust_config(config, support_level, info_density_pref, sensory_flags):
+    """The profile adjustments compute_config applies on top of the merged disorder rules."""
+    config = support_level_adjustments(config, support_level)
+    config = sensory_flags_adjustments(config, sensory_flags)
+
+    # User's explicit density pref can override if stronger
+    density_pri = PRIORITY["info_density"]
+    if density_pri.get(info_density_pref, 0) > density_pri.get(config["info_density"], 0):
+        config["info_density"] = info_density_pref
+    return config
+
+# ── Compiled rules ────────────────────────────────────────────────────────────
+RULE_DOMAIN = (1 << len(ALL_DISORDERS)) * len(SUPPORT_LEVELS) * len(DENSITY_PREFS) * (1 << len(SENSORY_FLAGS))
+
+# Content hash of the rule definitions, so artefacts derived from them can be tied to a version
+RULES_VERSION = hashlib.sha256(json.dumps(
+    [DISORDER_RULES, PRIORITY, BOOL_OUTPUTS, DEFAULT_CONFIG], sort_keys=True,
+).encode()).hexdigest()[:16]
+
+_COMPILED = None
+
+def rule_index(disorder_mask, support, density, sensory_mask):
+    """Cell of the compiled rules. Plain arithmetic, so it also works on NumPy arrays."""
+    return ((disorder_mask * len(SUPPORT_LEVELS) + support) * len(DENSITY_PREFS) + density) \
+        * (1 << len(SENSORY_FLAGS)) + sensory_mask
+
+def compile_rules():
+    """compute_config for every cell of the rule domain, as a list in rule_index order."""
+    flag_sets = [
+        [f for i, f in enumerate(SENSORY_FLAGS) if sensory_mask >> i & 1]
+        for sensory_mask in range(1 << len(SENSORY_FLAGS))
+    ]
+    configs = []
+    for disorder_mask in range(1 << len(ALL_DISORDERS)):
+        # Sorted, as generate_row() passes them: priority ties go to the first disorder
+        disorders = sorted(d for i, d in enumerate(ALL_DISORDERS) if disorder_mask >> i & 1)
+        # The merge only depends on the disorders, so it runs once per mask rather than per cell
+        merged = merge_disorders(disorders)
+        for support_level in SUPPORT_LEVELS:
+            for density_pref in DENSITY_PREFS:
+                for flags in flag_sets:
+                    configs.append(_adjust_config(dict(merged), support_level, density_pref, flags))
+    return configs
+
+def compiled():
+    """The compiled rule table, built on first use."""
+    global _COMPILED
+    if _COMPILED is None:
+        _COMPILED = compile_rules()
+    return _COMPILED
+
+def lookup(disorder_mask, support, density, sensory_mask):
+    """UI config for one encoded profile. The returned dict is shared — copy it before mutating."""
+    return compiled()[rule_index(disorder_mask, support, density, sensory_mask)]
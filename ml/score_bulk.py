@@ -0,0 +1,236 @@
+"""
+ml/score_bulk.py
+Offline bulk scoring of CAP exports, for nightly jobs that would otherwise call
+/predict once per student.
+
+Input is streamed from a JSONL file (one CAP profile object per line) or a CSV
+export with the fields encode_cap reads: support_level,
+information_density, time_horizon, sensory_flags and disorders. In CSV the two
+list fields may be JSON arrays or semicolon-separated ("adhd;dyslexia"); empty
+cells fall back to the same defaults as the server.
+
+Rows are scored in --chunk-size chunks across --workers processes, each chunk
+as one vectorized predict through predict_server.py's own feature encoding and
+predictor (VANTAGE_PREDICTOR etc. apply), so results match /predict exactly.
+At most two chunks per worker are in flight, which bounds memory whatever the
+input size. Rows are validated as strictly as the server validates requests
+(predict_server.encode_cap). Results are written as JSONL in input order:
+
+  {"line": 12, "id": "...", "ui_config": {...}}       (id when --id-field is present)
+  {"line": 13, "error": "line 13: disorders: entries must be one of ...", "details": [...]}
+
+A malformed row (bad JSON or CSV, bytes that are not UTF-8) produces an error
+line and the run carries on; the summary goes to stderr.
+
+Run: python3 ml/score_bulk.py caps.jsonl --out ui_configs.jsonl
+     python3 ml/score_bulk.py export.csv --out - --workers 4 [--probabilities] [--top-k 3]
+Requires: the trained model files (run train_model.py first), or VANTAGE_PREDICTOR=rules
+"""
+
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+CHUNK_SIZE  = 10_000
+LIST_FIELDS = ("sensory_flags", "disorders")
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+class ParseError:
+    """A row the reader could not turn into a record; scored as its error line."""
+
+    def __init__(self, message):
+        self.message = message
+
+def _utf8_problem(text):
+    """Why `text` (read with errors="surrogateescape") is not valid UTF-8, or None."""
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError as e:
+        return f"invalid UTF-8: byte 0x{ord(text[e.start]) - 0xDC00:02x} at column {e.start + 1}"
+    return None
+
+def read_jsonl(f):
+    """Yields (line number, record or ParseError)."""
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        problem = _utf8_problem(line)
+        if problem:
+            yield line_no, ParseError(problem)
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, ParseError(f"invalid JSON: {e.msg} (column {e.colno})")
+
+def _csv_list(value):
+    value = value.strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [v.strip() for v in value.split(";") if v.strip()]
+
+def read_csv(f):
+    """Yields (line number, record or ParseError); list cells are JSON arrays or a;b;c."""
+    reader = csv.DictReader(f)
+    try:
+        reader.fieldnames   # reads the header, so line_num below counts data rows from line 2
+    except csv.Error as e:
+        yield 1, ParseError(f"malformed CSV header: {e}")
+        return
+    while True:
+        start = reader.line_num + 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader has dropped the bad row and carries on from the next line
+            yield start, ParseError(f"malformed CSV: {e}")
+            continue
+        line_no = reader.line_num
+        if None in row:
+            yield line_no, ParseError(f"{len(reader.fieldnames) + len(row[None])} cells, "
+                                      f"header has {len(reader.fieldnames)}")
+            continue
+        problem = next(filter(None, map(_utf8_problem, filter(None, row.values()))), None)
+        if problem:
+            yield line_no, ParseError(problem)
+            continue
+        record = {}
+        try:
+            for field, value in row.items():
+                if value is None or value == "":
+                    continue
+                record[field] = _csv_list(value) if field in LIST_FIELDS else value
+        except json.JSONDecodeError as e:
+            yield line_no, ParseError(f"{field}: invalid JSON list: {e.msg}")
+            continue
+        yield line_no, record
+
+def read_records(path, fmt):
+    # Undecodable bytes survive as surrogates and are reported per line by the readers
+    if path == "-":
+        opener = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="surrogateescape", newline="")
+    else:
+        opener = open(path, newline="", encoding="utf-8", errors="surrogateescape")
+    with opener as f:
+        yield from (read_csv(f) if fmt == "csv" else read_jsonl(f))
+
+def chunked(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ── Scoring (runs in the workers) ─────────────────────────────────────────────
+_OPTIONS = {}
+
+def _init_worker(id_field, probabilities, top_k):
+    # Loads the model once per worker process (the flat export is memory-mapped and shared)
+    global predict_server
+    import predict_server
+    _OPTIONS.update(id_field=id_field, probabilities=probabilities, top_k=top_k)
+
+def score_chunk(chunk):
+    """Score one chunk of (line number, record or ParseError) and return its output lines, in order."""
+    id_field = _OPTIONS["id_field"]
+    out   = [None] * len(chunk)
+    valid = []
+    keys  = []
+    for i, (line_no, record) in enumerate(chunk):
+        if isinstance(record, ParseError):
+            out[i] = {"line": line_no, "error": f"line {line_no}: {record.message}"}
+            continue
+        key, problems = predict_server.profile_problems(record)
+        if problems:
+            message = "; ".join(f"{p['field']}: {p['message']}" for p in problems)
+            out[i]  = {"line": line_no, "error": f"line {line_no}: {message}", "details": problems}
+        else:
+            valid.append(i)
+            keys.append(key)
+
+    if valid:
+        state  = predict_server.STATE
+        keys   = np.array(keys, dtype=np.int64)
+        bodies = predict_server.response_bodies(keys, state, _OPTIONS["probabilities"], _OPTIONS["top_k"])
+        for i, body in zip(valid, bodies):
+            line_no, record = chunk[i]
+            head = {"line": line_no, "id": record[id_field]} if id_field in record else {"line": line_no}
+            out[i] = dict(head, **body)
+
+    errors = sum("error" in o for o in out)
+    return [json.dumps(o) + "\n" for o in out], errors
+
+def scored_chunks(chunks, workers, initargs):
+    """Yields score_chunk results in input order, with at most 2 × workers chunks in flight."""
+    if workers <= 1:
+        _init_worker(*initargs)
+        yield from map(score_chunk, chunks)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Score a CAP export into ui_configs.")
+    parser.add_argument("input", help="JSONL or CSV export ('-' reads stdin)")
+    parser.add_argument("--out", default="-", help="output JSONL ('-' writes stdout, the default)")
+    parser.add_argument("--format", choices=["jsonl", "csv"],
+                        help="input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="scoring processes; 1 scores in-process")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="profiles per vectorized predict")
+    parser.add_argument("--id-field", default="id", help="input field copied to each result when present")
+    parser.add_argument("--probabilities", action="store_true", help="add calibrated class probabilities")
+    parser.add_argument("--top-k", type=int, default=0, help="add up to k most likely whole configs")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    if args.top_k:
+        # Same bounds and message as /predict (loading the model here is cheap: the flat export is mmapped)
+        import predict_server
+        try:
+            predict_server.prediction_options({"top_k": args.top_k})
+        except predict_server.RequestError as e:
+            parser.error(str(e))
+
+    chunks   = chunked(read_records(args.input, fmt), args.chunk_size)
+    initargs = (args.id_field, args.probabilities, args.top_k)
+    out      = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+
+    t0 = time.perf_counter()
+    rows = errors = 0
+    try:
+        for lines, n_errors in scored_chunks(chunks, args.workers, initargs):
+            out.writelines(lines)
+            rows   += len(lines)
+            errors += n_errors
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Scored {rows - errors:,} of {rows:,} rows in {elapsed:.1f}s "
+          f"({rows / max(elapsed, 1e-9):,.0f} rows/s, {args.workers} worker(s)) → {args.out}", file=sys.stderr)
+    if errors:
+        print(f"⚠️  {errors:,} malformed rows reported as error lines", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+ml/serve.py
+Production entry point for the UI config prediction service.
+
+Two serving modes, both exposing the same /predict, /health, /metrics and
+/admin/reload contracts as predict_server.py:
+
+  workers  gunicorn pre-fork server (gthread workers, so client connections
+           stay open for --keepalive seconds). The model is loaded once in the
+           master (preload_app) and the flat arrays are memory-mapped, so every
+           worker shares the same pages. Each worker runs its own model file watcher
+           and hot-reloads on its own; /admin/reload reaches only the worker
+           that accepts it, so rely on the watcher with more than one.
+  async    aiohttp event loop with a micro-batcher: /predict requests that
+           arrive within --batch-window-ms of each other are encoded and scored
+           as one matrix, up to --max-batch profiles per model call.
+
+Run: python3 ml/serve.py --mode workers --workers 4
+     python3 ml/serve.py --mode async --batch-window-ms 2 --max-batch 256
+Requires: gunicorn (workers mode) or aiohttp (async mode)
+
+Measured ceiling on 1 vCPU, 64 concurrent keep-alive clients on the same box
+(the load generator shares the core, so these are floors for real hardware):
+
+                                     lookup table    flat forests only
+  dev server (predict_server.py)       ~460 req/s        ~210 req/s
+  workers, 2 workers                   ~480 req/s        ~230 req/s
+  async, 2 ms window, batches ≤ 256   ~2600 req/s       ~1060 req/s
+
+Workers mode scales with cores; a single async process is bounded by HTTP and
+JSON handling rather than by the model call.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import numpy as np
+
+# ── Workers mode (gunicorn) ───────────────────────────────────────────────────
+def serve_workers(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("workers mode needs gunicorn: pip install gunicorn")
+
+    class PreloadedApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind",         f"{args.host}:{args.port}")
+            self.cfg.set("workers",      args.workers)
+            self.cfg.set("threads",      args.threads)
+            # Sync workers close every connection; gthread keeps them alive for --keepalive seconds
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app",  True)
+            self.cfg.set("keepalive",    args.keepalive)
+            self.cfg.set("post_fork",    post_fork)
+
+        def load(self):
+            import predict_server
+            return predict_server.app
+
+    def post_fork(server, worker):
+        # Threads do not survive the fork, so the watcher starts per worker
+        import predict_server
+        predict_server.start_watcher()
+
+    print(f"🧠 Vantage UI Config Model Server — http://{args.host}:{args.port}  "
+          f"({args.workers} workers × {args.threads} threads)")
+    PreloadedApp().run()
+
+# ── Async mode (aiohttp + micro-batching) ─────────────────────────────────────
+class MicroBatcher:
+    """
+    Collects profile keys (validated CAP profiles, see predict_server.encode_cap)
+    submitted within a short window and scores them in one predict_matrix
+    call. The model call runs in a thread so the event loop keeps accepting
+    requests — which is what fills the next batch.
+    """
+
+    def __init__(self, predictor, window_s, max_batch):
+        self.predictor = predictor
+        self.window_s  = window_s
+        self.max_batch = max_batch
+        self.queue     = asyncio.Queue()
+
+    async def submit(self, key, state):
+        """Config for `key` scored by `state`, the model the request's ETag names."""
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((key, state, fut))
+        return await fut
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.window_s > 0:
+                await asyncio.sleep(self.window_s)
+                self._drain(batch)
+
+            # One model call per state: only a batch straddling a hot reload has two
+            by_state = {}
+            for item in batch:
+                by_state.setdefault(id(item[1]), []).append(item)
+            for items in by_state.values():
+                await self._resolve(loop, items)
+
+    async def _resolve(self, loop, items):
+        keys = [key for key, _, _ in items]
+        try:
+            configs = await loop.run_in_executor(None, self._score, keys, items[0][1])
+        except Exception as e:
+            for _, _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, _, fut), config in zip(items, configs):
+            if not fut.done():
+                fut.set_result(config)
+
+    def _score(self, keys, state):
+        p = self.predictor
+        p.BATCH_SIZES.observe(len(keys))
+        with p.STAGES.time("predict"):
+            codes = p.predict_matrix(np.array(keys, dtype=np.int64), state)
+        with p.STAGES.time("decode"):
+            return [p.decode_codes(row, state) for row in codes]
+
+def serve_async(args):
+    try:
+        from aiohttp import web
+    except ImportError:
+        raise SystemExit("async mode needs aiohttp: pip install aiohttp")
+
+    import predict_server
+
+    batcher = MicroBatcher(predict_server, args.batch_window_ms / 1000, args.max_batch)
+
+    stages = predict_server.STAGES
+
+    def score_detailed(key, state, probabilities, top_k):
+        keys = np.array([key], dtype=np.int64)
+        return predict_server.response_bodies(keys, state, probabilities, top_k)[0]
+
+    async def predict(request):
+        try:
+            body = await request.read()
+            with stages.time("parse"):
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    raise predict_server.RequestError("request body must be a JSON object")
+                probabilities, top_k = predict_server.prediction_options(data)
+            with stages.time("features"):
+                key = predict_server.encode_cap(data.get("cap_profile", {}))
+            state = predict_server.STATE
+            etag  = predict_server.response_etag(key, state, probabilities, top_k)
+            if predict_server.etag_matches(request.headers.get("If-None-Match"), etag):
+                predict_server.REQUESTS.inc("predict", "304")
+                return web.Response(status=304, headers=predict_server.cache_headers(etag))
+            if probabilities or top_k:
+                # Probabilities need the forest pass itself, so these skip the batcher
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, score_detailed, key, state, probabilities, top_k)
+            else:
+                result = {"ui_config": await batcher.submit(key, state)}
+            with stages.time("serialize"):
+                response = web.json_response(result, headers=predict_server.cache_headers(etag))
+        except predict_server.RequestError as e:
+            predict_server.REQUESTS.inc("predict", str(e.status))
+            return web.json_response(e.payload(), status=e.status)
+        except Exception as e:
+            predict_server.ERRORS.inc("predict", type(e).__name__)
+            predict_server.REQUESTS.inc("predict", "500")
+            return web.json_response({"error": str(e)}, status=500)
+        predict_server.REQUESTS.inc("predict", "200")
+        return response
+
+    async def health(request):
+        return web.json_response(predict_server.health_payload())
+
+    async def metrics(request):
+        return web.Response(
+            text=predict_server.METRICS.render(),
+            headers={"Content-Type": predict_server.metrics.Registry.CONTENT_TYPE},
+        )
+
+    async def admin_reload(request):
+        if not predict_server.admin_allowed(request.headers, request.remote):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        force  = request.query.get("force") == "1"
+        result = await asyncio.get_running_loop().run_in_executor(None, predict_server.reload_model, force)
+        return web.json_response(result, status=409 if result["status"] == "rejected" else 200)
+
+    async def start_batcher(app):
+        app["batcher"] = asyncio.create_task(batcher.run())
+        predict_server.start_watcher()
+
+    async def stop_batcher(app):
+        app["batcher"].cancel()
+
+    app = web.Application()
+    app.router.add_post("/predict", predict)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/admin/reload", admin_reload)
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+
+    print(f"🧠 Vantage UI Config Model Server — http://{args.host}:{args.port}  "
+          f"(async, {args.batch_window_ms} ms window, batches ≤ {args.max_batch})")
+    web.run_app(app, host=args.host, port=args.port, keepalive_timeout=args.keepalive, print=None)
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Serve the UI config model.")
+    parser.add_argument("--mode", choices=["workers", "async"], default="workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("VANTAGE_WORKERS", os.cpu_count() or 1)),
+                        help="gunicorn worker processes (workers mode)")
+    parser.add_argument("--threads", type=int, default=1, help="threads per worker (workers mode)")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0,
+                        help="how long to collect concurrent requests into one batch (async mode)")
+    parser.add_argument("--max-batch", type=int, default=256, help="largest batch per model call (async mode)")
+    parser.add_argument("--keepalive", type=int, default=5, help="keep-alive timeout in seconds")
+    args = parser.parse_args()
+
+    if args.mode == "workers":
+        serve_workers(args)
+    else:
+        serve_async(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+ml/test_calibration.py
+Temperature scaling keeps the forests' uncertainty visible: fitted
+temperatures never sharpen, and a coin-flip vote stays a coin-flip.
+
+Run: python3 -m pytest ml/test_calibration.py -q
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import calibration
+
+METADATA_PATH = os.path.join(os.path.dirname(__file__), "models", "model_metadata.json")
+COIN_FLIP     = np.array([[0.514, 0.486]])
+
+def near_certain(n=2_000, seed=0):
+    """Votes that are almost always right: the NLL keeps falling as T shrinks."""
+    rng   = np.random.default_rng(seed)
+    y     = rng.integers(0, 2, n)
+    share = rng.uniform(0.9, 1.0, n)
+    proba = np.column_stack([np.where(y == 0, share, 1 - share), np.where(y == 1, share, 1 - share)])
+    return proba, y
+
+def test_apply_keeps_the_raw_vote_at_t_1():
+    assert np.array_equal(calibration.apply(COIN_FLIP, 1.0), COIN_FLIP)
+
+def test_fit_never_sharpens():
+    proba, y = near_certain()
+    t = calibration.fit_temperature(proba, y)
+    assert t >= 1.0
+    assert calibration.apply(COIN_FLIP, t).max() < 0.6
+
+def test_grid_edge_fit_keeps_t_1():
+    # Labels the votes get wrong 60% of the time want T beyond the grid's top
+    rng   = np.random.default_rng(1)
+    proba = np.tile([[0.6, 0.4]], (1_000, 1))
+    y     = (rng.random(1_000) < 0.6).astype(int)
+    assert calibration.fit_temperature(proba, y) == 1.0
+
+def test_interior_fit():
+    # Votes of 0.95 that are right 80% of the time are over-confident: a T > 1 fits
+    rng   = np.random.default_rng(2)
+    proba = np.tile([[0.95, 0.05]], (5_000, 1))
+    y     = (rng.random(5_000) < 0.2).astype(int)
+    t = calibration.fit_temperature(proba, y)
+    assert 1.0 < t < calibration.TEMPERATURES[-1]
+
+@pytest.mark.skipif(not os.path.exists(METADATA_PATH), reason="no trained model metadata")
+def test_committed_temperatures_keep_coin_flips_low():
+    with open(METADATA_PATH) as f:
+        fitted = json.load(f)["calibration"]
+    for target, c in fitted.items():
+        assert c["temperature"] >= 1.0, target
+        assert calibration.apply(COIN_FLIP, c["temperature"]).max() < 0.6, target
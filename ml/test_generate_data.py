@@ -0,0 +1,72 @@
+"""
+ml/test_generate_data.py
+Equivalence of the vectorized generator (generate_chunk / compute_config_vec)
+and the row-wise one (generate_row / compute_config), at fixed seeds.
+
+Run: python3 -m pytest ml/test_generate_data.py -q
+"""
+
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import generate_data
+from generate_data import ALL_DISORDERS, BOOL_OUTPUTS, COLUMNS, PRIORITY, SENSORY_FLAGS
+
+N = 20_000
+# Largest allowed gap between the two generators' share of any column value;
+# two independent samples of N rows differ by ~0.005 at most, so this is ~5σ
+TOLERANCE = 0.025
+
+@pytest.fixture(scope="module")
+def rowwise():
+    random.seed(0)
+    rows = [generate_data.generate_row() for _ in range(N)]
+    return {name: [row[name] for row in rows] for name in COLUMNS}
+
+@pytest.fixture(scope="module")
+def vectorized():
+    return generate_data.generate_chunk(np.random.default_rng(0), N)
+
+def shares(values):
+    counts = Counter(str(v) for v in values)
+    return {value: count / len(values) for value, count in counts.items()}
+
+def test_vectorized_rules_match_scalar_rules():
+    n_profiles, mismatches = generate_data.verify_vectorized()
+    assert n_profiles == (1 << len(ALL_DISORDERS)) * 3 * 3 * (1 << len(SENSORY_FLAGS))
+    assert mismatches == 0
+
+def test_same_columns(rowwise, vectorized):
+    assert list(vectorized) == COLUMNS
+    assert all(len(vectorized[name]) == N for name in COLUMNS)
+
+@pytest.mark.parametrize("column", COLUMNS)
+def test_column_distribution(rowwise, vectorized, column):
+    expected, actual = shares(rowwise[column]), shares(vectorized[column])
+    gap = max(abs(expected.get(v, 0.0) - actual.get(v, 0.0)) for v in set(expected) | set(actual))
+    assert gap < TOLERANCE, f"{column}: shares differ by {gap:.3f}"
+
+def test_targets_follow_the_rules_without_noise():
+    chunk = generate_data.generate_chunk(np.random.default_rng(1), 2_000, noise_level=0.0)
+    for i in range(2_000):
+        disorders = sorted(d for d in ALL_DISORDERS if chunk[f"has_{d}"][i])
+        flags     = [f for f in SENSORY_FLAGS if chunk[f][i]]
+        config    = generate_data.compute_config(
+            disorders, str(chunk["support_level"][i]), str(chunk["info_density_pref"][i]), flags)
+        assert chunk["n_disorders"][i] == len(disorders)
+        for field in PRIORITY:
+            assert chunk[field][i] == config[field], (i, field)
+        for field in BOOL_OUTPUTS:
+            assert bool(chunk[field][i]) == config[field], (i, field)
+
+def test_typed_chunk_encodes_the_same_rows():
+    plain = generate_data.generate_chunk(np.random.default_rng(2), 1_000)
+    typed = generate_data.generate_chunk(np.random.default_rng(2), 1_000, typed=True)
+    assert list(typed) == generate_data.TYPED_COLUMNS
+    for field in PRIORITY:
+        decoded = np.array(generate_data.FIELD_VALUES[field])[typed[field]]
+        assert (decoded == plain[field]).all()
+    assert (np.array(generate_data.TIME_HORIZONS)[typed["time_horizon_enc"]] == plain["time_horizon"]).all()
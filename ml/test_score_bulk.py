@@ -0,0 +1,58 @@
+"""
+ml/test_score_bulk.py
+A bad row in a CAP export becomes that row's error line; the rest still scores.
+
+Run: python3 -m pytest ml/test_score_bulk.py -q
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import score_bulk
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CAP  = {"support_level": "high", "disorders": ["adhd"], "sensory_flags": ["light_sensitivity"]}
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def jsonl_with_bad_byte():
+    good = json.dumps(CAP).encode()
+    bad  = good.replace(b'"high"', b'"hi\xffgh"')
+    return b"\n".join([good, good, bad, good]) + b"\n"
+
+def test_jsonl_reports_invalid_utf8_on_its_line(tmp_path):
+    path    = write(tmp_path, "caps.jsonl", jsonl_with_bad_byte())
+    records = list(score_bulk.read_records(path, "jsonl"))
+    assert [line for line, _ in records] == [1, 2, 3, 4]
+    assert isinstance(records[2][1], score_bulk.ParseError)
+    assert "invalid UTF-8: byte 0xff" in records[2][1].message
+    assert all(record == CAP for i, (_, record) in enumerate(records) if i != 2)
+
+def test_csv_reports_invalid_utf8_and_malformed_rows(tmp_path):
+    data = (b"support_level,disorders\n"
+            b"high,adhd\n"
+            b"hi\xffgh,adhd\n"
+            b"\"" + b"x" * 200_000 + b"\",adhd\n"      # over csv.field_size_limit
+            b"low,adhd;dyslexia\n")
+    path    = write(tmp_path, "caps.csv", data)
+    records = list(score_bulk.read_records(path, "csv"))
+    assert [line for line, _ in records] == [2, 3, 4, 5]
+    assert "invalid UTF-8" in records[1][1].message
+    assert "malformed CSV" in records[2][1].message
+    assert records[3][1] == {"support_level": "low", "disorders": ["adhd", "dyslexia"]}
+
+def test_cli_scores_around_a_corrupt_line(tmp_path):
+    path = write(tmp_path, "caps.jsonl", jsonl_with_bad_byte())
+    out  = tmp_path / "out.jsonl"
+    run  = subprocess.run([sys.executable, os.path.join(HERE, "score_bulk.py"), path, "--out", str(out),
+                           "--workers", "1"],
+                          env=dict(os.environ, VANTAGE_PREDICTOR="rules"), capture_output=True, text=True)
+    assert run.returncode == 0, run.stderr
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [line["line"] for line in lines] == [1, 2, 3, 4]
+    assert "error" in lines[2] and all("ui_config" in lines[i] for i in (0, 1, 3))
@@ -1,21 +1,49 @@
 """
 train_model.py
 Trains Random Forest classifiers on the synthetic neurodivergent dataset.
-Saves individual per-output models + a unified config dict to ml/models/.
+Saves individual per-output models + a unified config dict to ml/models/,
+plus a flat, memory-mappable export of the trees (see ml/flat_forest.py).
 
-Run: python3 ml/train_model.py
+Run: python3 ml/train_model.py [--fused] [--data PATH] [--search [--tolerance 0.005]]
 Requires: ml/data/synthetic_profiles.csv (run generate_data.py first)
+          .parquet / .feather datasets from generate_data.py are read directly,
+          loading only the feature and target columns (ordinals pre-encoded)
+          pandas and scikit-learn are imported by the functions that use them,
+          so importing this module for its constants stays cheap
+
+--fused trains one multi-output forest over all nine targets instead of nine
+independent forests; the saved bundle keeps the same format (see ml/fused.py).
+
+All fits (each model plus its 5 CV folds) run as one job graph over --workers
+processes, sharing a single train/test split and fold assignment; per-stage
+timings are printed at the end.
+
+Class probabilities are calibrated per target by temperature scaling (see
+ml/calibration.py), fitted on the CV folds' out-of-fold probabilities of the
+train rows and scored on the untouched held-out split; the temperatures are
+stored in the bundle under "calibration" and reported in model_metadata.json.
+
+--search replaces the one-size RF_PARAMS with the cheapest forest per model
+(fewest trees × levels walked) whose CV accuracy stays within --tolerance of
+the RF_PARAMS baseline on every target. The chosen parameters and measured
+one-row predict latency are recorded in model_metadata.json either way.
 """
 
+import argparse
+import contextlib
+import itertools
 import os
 import pickle
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report, accuracy_score
+
+import calibration
+import flat_forest
+import lookup_table
+from fused import FusedTargetModel
+from lookup_table import bundle_version
 
 # ── Config ────────────────────────────────────────────────────────────────────
 DATA_PATH   = "ml/data/synthetic_profiles.csv"
@@ -46,6 +74,25 @@ RF_PARAMS = {
 }
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
+STAGE_TIMES = {}
+
+@contextlib.contextmanager
+def stage(name):
+    """Accumulate wall-clock time per pipeline stage into STAGE_TIMES."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_TIMES[name] = STAGE_TIMES.get(name, 0.0) + time.perf_counter() - t0
+
+def stage_report():
+    print(f"\n{'═'*50}")
+    print("  STAGE TIMINGS")
+    print(f"{'═'*50}")
+    for name, seconds in STAGE_TIMES.items():
+        print(f"  {name:20s}  {seconds:8.2f}s")
+    print(f"  {'total':20s}  {sum(STAGE_TIMES.values()):8.2f}s")
+
 def encode_ordinals(df):
     """Encode categorical feature columns into numeric."""
     support_map     = {"low": 0, "medium": 1, "high": 2}
@@ -57,29 +104,6 @@ def encode_ordinals(df):
     df["time_horizon_enc"]      = df["time_horizon"].map(horizon_map)
     return df
 
-def train_and_evaluate(X_train, X_test, y_train, y_test, target_name, le=None):
-    """Train a Random Forest, evaluate, and return (model, label_encoder)."""
-    clf = RandomForestClassifier(**RF_PARAMS)
-    clf.fit(X_train, y_train)
-
-    y_pred = clf.predict(X_test)
-    acc = accuracy_score(y_test, y_pred)
-
-    print(f"\n{'─'*50}")
-    print(f"  Target: {target_name}")
-    print(f"  Test accuracy:  {acc:.4f}")
-
-    cv_scores = cross_val_score(clf, X_train, y_train, cv=5, scoring="accuracy")
-    print(f"  CV accuracy:    {cv_scores.mean():.4f} ± {cv_scores.std():.4f}")
-
-    if le:
-        print(f"\n{classification_report(y_test, y_pred, target_names=le.classes_)}")
-    else:
-        unique = sorted(set(y_test))
-        print(f"\n{classification_report(y_test, y_pred, target_names=[str(u) for u in unique])}")
-
-    return clf
-
 def feature_importance_report(models, feature_names):
     """Print top features across all models."""
     print(f"\n{'═'*50}")
@@ -97,75 +121,464 @@ def feature_importance_report(models, feature_names):
         bar = "█" * int(imp * 100)
         print(f"  {fname:30s}  {imp:.4f}  {bar}")
 
-# ── Main ──────────────────────────────────────────────────────────────────────
-def main():
-    os.makedirs(MODELS_DIR, exist_ok=True)
-
-    print("📂 Loading data...")
-    df = pd.read_csv(DATA_PATH)
-    print(f"   {len(df)} rows × {len(df.columns)} columns")
-
-    df = encode_ordinals(df)
-    X = df[FEATURE_COLS].values
+def print_report(y_test, y_pred, le=None):
+    """Print the per-class report for one target."""
+    from sklearn.metrics import classification_report
+    if le:
+        print(f"\n{classification_report(y_test, y_pred, target_names=le.classes_)}")
+    else:
+        unique = sorted(set(y_test))
+        print(f"\n{classification_report(y_test, y_pred, target_names=[str(u) for u in unique])}")
 
-    models   = {}
+def encode_targets(df):
+    """Label-encode the categorical targets; returns ({target: y}, encoders)."""
+    from sklearn.preprocessing import LabelEncoder
+    ys       = {}
     encoders = {}
-
-    # ── Categorical targets ───────────────────────────────────────────────────
-    print(f"\n{'═'*50}")
-    print("  CATEGORICAL TARGET CLASSIFIERS")
-    print(f"{'═'*50}")
-
     for target in CATEGORICAL_TARGETS:
         le = LabelEncoder()
-        y  = le.fit_transform(df[target])
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        clf = train_and_evaluate(X_train, X_test, y_train, y_test, target, le)
-        models[target]   = clf
+        ys[target]       = le.fit_transform(df[target])
         encoders[target] = le
+    for target in BINARY_TARGETS:
+        ys[target] = df[target].values
+    return ys, encoders
+
+# ── Training job graph ────────────────────────────────────────────────────────
+# Every (model, fold) pair is an independent job: one final fit on the shared
+# training split plus CV_FOLDS refits per model. The split and folds are drawn
+# once and reused by every target, and each forest runs single-threaded so the
+# process pool is the only source of parallelism (no n_jobs=-1 oversubscription).
+CV_FOLDS = 5
+
+_JOB_DATA = {}
+
+def _init_jobs(X, Y, train_idx, folds):
+    _JOB_DATA.update(X=X, Y=Y, train_idx=train_idx, folds=folds)
+
+def _forest(params):
+    """Single-threaded forest with RF_PARAMS overridden by `params` ((name, value) pairs)."""
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(**dict(RF_PARAMS, **dict(params), n_jobs=1))
+
+def _run_job(job):
+    """
+    Fit one forest. `columns` selects the Y column(s) it learns (an int for a
+    single target, a list for a fused multi-output forest) and `params`
+    overrides RF_PARAMS. Final jobs return the model; fold jobs return their
+    validation accuracy per column and the out-of-fold class probabilities
+    (see _fold_proba).
+    """
+    columns, fold, params = job
+    X, Y = _JOB_DATA["X"], _JOB_DATA["Y"]
+    t0 = time.perf_counter()
+
+    if fold is None:
+        rows = _JOB_DATA["train_idx"]
+        clf  = _forest(params).fit(X[rows], Y[rows][:, columns])
+        clf.set_params(n_jobs=RF_PARAMS["n_jobs"])
+        return job, clf, time.perf_counter() - t0
+
+    tr, va = _JOB_DATA["folds"][fold]
+    clf    = _forest(params).fit(X[tr], Y[tr][:, columns])
+    proba  = _fold_proba(clf, X[va], np.atleast_1d(columns), Y)
+    # argmax over codes is what clf.predict returns (classes_ are sorted codes)
+    pred   = np.column_stack([p.argmax(axis=1) for p in proba])
+    acc    = (pred == Y[va][:, np.atleast_1d(columns)]).mean(axis=0)
+    return job, (acc, proba), time.perf_counter() - t0
+
+def _fold_proba(clf, X, columns, Y):
+    """
+    [(n, n_labels) float32 probabilities per column], widened to every label
+    code in Y: a fold may not have seen every class, so clf.classes_ can be short.
+    """
+    raw     = clf.predict_proba(X)
+    classes = clf.classes_
+    if len(columns) == 1 and not isinstance(raw, list):
+        raw, classes = [raw], [classes]
+    out = []
+    for c, p, cls in zip(columns, raw, classes):
+        full = np.zeros((len(X), int(Y[:, c].max()) + 1), dtype=np.float32)
+        full[:, np.asarray(cls, dtype=int)] = p
+        out.append(full)
+    return out
+
+def _split(X):
+    from sklearn.model_selection import train_test_split, KFold
+    train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+    folds = [(train_idx[tr], train_idx[va]) for tr, va in KFold(n_splits=CV_FOLDS).split(train_idx)]
+    return train_idx, test_idx, folds
+
+@contextlib.contextmanager
+def _job_runner(X, Y, train_idx, folds, workers):
+    """Yields run(jobs) -> results, backed by one process pool for all its calls."""
+    if workers <= 1:
+        _init_jobs(X, Y, train_idx, folds)
+        yield lambda jobs: [_run_job(job) for job in jobs]
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_jobs,
+                             initargs=(X, Y, train_idx, folds)) as pool:
+        yield lambda jobs: list(pool.map(_run_job, jobs))
+
+def _group_key(group):
+    return tuple(group) if isinstance(group, list) else group
+
+def run_job_graph(X, Y, groups, workers, params=None):
+    """
+    Fit every group in `groups` (Y column selectors) on the shared split, plus
+    its CV folds, over a process pool. `params` optionally maps a group key to
+    RF_PARAMS overrides. Returns (split, {group: model}, {group: (CV_FOLDS,
+    n_columns) fold accuracies}, {group: [(train rows, out-of-fold
+    probabilities) per column]}, summed job seconds).
+    """
+    train_idx, test_idx, folds = _split(X)
+    params = params or {}
+
+    # Final fits first: they are the ones the bundle waits on
+    overrides = {_group_key(g): tuple(sorted(params.get(_group_key(g), {}).items())) for g in groups}
+    jobs = [(g, None, overrides[_group_key(g)]) for g in groups] + \
+           [(g, k, overrides[_group_key(g)]) for g in groups for k in range(CV_FOLDS)]
+
+    with _job_runner(X, Y, train_idx, folds, workers) as run:
+        results = run(jobs)
+
+    models, cv_scores, fold_proba, job_seconds = {}, {}, {}, 0.0
+    for (group, fold, _), out, elapsed in results:
+        key = _group_key(group)
+        job_seconds += elapsed
+        if fold is None:
+            models[key] = out
+        else:
+            acc, proba = out
+            cv_scores.setdefault(key, np.zeros((CV_FOLDS, len(acc))))[fold] = acc
+            fold_proba.setdefault(key, [None] * CV_FOLDS)[fold] = proba
+
+    # Folds partition the train rows, so their validation predictions cover each one once
+    rows = np.concatenate([va for _, va in folds])
+    oof  = {
+        key: [(rows, np.concatenate([per_fold[k][c] for k in range(CV_FOLDS)]))
+              for c in range(len(per_fold[0]))]
+        for key, per_fold in fold_proba.items()
+    }
+    return (train_idx, test_idx), models, cv_scores, oof, job_seconds
+
+# ── Compression search ────────────────────────────────────────────────────────
+# Candidate forests are tried from cheapest to most expensive to serve; each
+# group keeps the first one whose CV accuracy on every column is within the
+# tolerance of the RF_PARAMS baseline. Serving cost is trees × levels walked.
+SEARCH_GRID = {
+    "n_estimators":     [10, 25, 50, 100, 200],
+    "max_depth":        [4, 6, 8, 12],
+    "min_samples_leaf": [1, 3, 10],
+}
+SEARCH_TOLERANCE = 0.005
+
+def _serving_cost(params):
+    # Ties go to the larger leaves, i.e. the smaller trees
+    return params["n_estimators"] * params["max_depth"], -params["min_samples_leaf"]
+
+def search_candidates():
+    """Grid points cheaper to serve than RF_PARAMS, cheapest first."""
+    names = list(SEARCH_GRID)
+    grid  = [dict(zip(names, values)) for values in itertools.product(*SEARCH_GRID.values())]
+    baseline = {name: RF_PARAMS[name] for name in names}
+    return sorted((p for p in grid if _serving_cost(p) < _serving_cost(baseline)), key=_serving_cost)
+
+def search_params(X, Y, groups, workers, tolerance=SEARCH_TOLERANCE):
+    """
+    Pick the cheapest forest per group within `tolerance` CV accuracy of
+    RF_PARAMS. Returns {group key: {"params", "cv", "baseline_cv"}}, with
+    params {} where nothing cheaper qualified.
+    """
+    train_idx, _, folds = _split(X)
+    pending = {_group_key(g): g for g in groups}
+    chosen  = {}
+
+    def cv_means(results):
+        scores = {}
+        for (group, fold, _), (acc, _), _ in results:
+            scores.setdefault(_group_key(group), np.zeros((CV_FOLDS, len(acc))))[fold] = acc
+        return {key: s.mean(axis=0) for key, s in scores.items()}
+
+    with _job_runner(X, Y, train_idx, folds, workers) as run:
+        baseline = cv_means(run([(g, k, ()) for g in groups for k in range(CV_FOLDS)]))
+
+        for candidate in search_candidates():
+            if not pending:
+                break
+            items = tuple(sorted(candidate.items()))
+            means = cv_means(run([(g, k, items) for g in pending.values() for k in range(CV_FOLDS)]))
+            for key, mean in means.items():
+                if np.all(mean >= baseline[key] - tolerance):
+                    chosen[key] = {"params": candidate, "cv": mean, "baseline_cv": baseline[key]}
+                    del pending[key]
+
+    for key in pending:
+        chosen[key] = {"params": {}, "cv": baseline[key], "baseline_cv": baseline[key]}
+    return chosen
+
+def predict_latency_ms(predict, x, calls=50):
+    """Median time of predict(x) in milliseconds."""
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        predict(x)
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples) * 1e3)
+
+def search_report(found, targets_of, tolerance):
+    print(f"\n{'═'*72}")
+    print(f"  COMPRESSION SEARCH (within {tolerance:.1%} of baseline CV accuracy)")
+    print(f"{'═'*72}")
+    print(f"  {'model':22s}  {'trees':>5s}  {'depth':>5s}  {'leaf':>4s}  {'cv acc':>8s}  {'baseline':>8s}")
+    for key, result in sorted(found.items()):
+        p = dict({n: RF_PARAMS[n] for n in SEARCH_GRID}, **result["params"])
+        for target, cv, base in zip(targets_of(key), result["cv"], result["baseline_cv"]):
+            print(f"  {target:22s}  {p['n_estimators']:5d}  {p['max_depth']:5d}  {p['min_samples_leaf']:4d}"
+                  f"  {cv:8.4f}  {base:8.4f}")
+
+def _print_target(target, y_test, y_pred, cv, le=None):
+    from sklearn.metrics import accuracy_score
+    print(f"\n{'─'*50}")
+    print(f"  Target: {target}")
+    print(f"  Test accuracy:  {accuracy_score(y_test, y_pred):.4f}")
+    print(f"  CV accuracy:    {cv.mean():.4f} ± {cv.std():.4f}")
+    print_report(y_test, y_pred, le)
+
+def train_separate(X, ys, encoders, workers=1, params=None, oof=None):
+    """
+    Fit one forest per target; `params` maps targets to RF_PARAMS overrides.
+    Returns {target: model}; `oof`, when given, is filled with each target's
+    out-of-fold (train rows, probabilities) for calibration.
+    """
+    Y = np.column_stack([ys[t] for t in ALL_TARGETS])
+    groups = list(range(len(ALL_TARGETS)))
+    params = {ALL_TARGETS.index(t): p for t, p in (params or {}).items()}
+
+    with stage("fit + cv"):
+        (_, test_idx), fitted, cv_scores, fold_proba, job_s = run_job_graph(X, Y, groups, workers, params)
+    if oof is not None:
+        oof.update((ALL_TARGETS[j], fold_proba[j][0]) for j in groups)
+    print(f"   {len(groups) * (CV_FOLDS + 1)} forest fits, {job_s:.1f}s of work on {workers} worker(s)")
+
+    models = {}
+    with stage("evaluate"):
+        for j, target in enumerate(ALL_TARGETS):
+            if target == CATEGORICAL_TARGETS[0]:
+                print(f"\n{'═'*50}")
+                print("  CATEGORICAL TARGET CLASSIFIERS")
+                print(f"{'═'*50}")
+            elif target == BINARY_TARGETS[0]:
+                print(f"\n{'═'*50}")
+                print("  BINARY TARGET CLASSIFIERS")
+                print(f"{'═'*50}")
+
+            clf = fitted[j]
+            _print_target(target, Y[test_idx, j], clf.predict(X[test_idx]), cv_scores[j], encoders.get(target))
+            models[target] = clf
+
+    return models
+
+def train_fused(X, ys, encoders, workers=1, params=None, oof=None):
+    """
+    Fit a single multi-output forest over every target, so all nine outputs
+    share trees and splits. `params` overrides RF_PARAMS for it. Returns
+    {target: FusedTargetModel}; `oof` is filled as in train_separate.
+    """
+    Y = np.column_stack([ys[t] for t in ALL_TARGETS])
+    columns = list(range(len(ALL_TARGETS)))
+
+    with stage("fit + cv"):
+        (_, test_idx), fitted, cv_scores, fold_proba, job_s = run_job_graph(
+            X, Y, [columns], workers, {tuple(columns): params or {}})
+    if oof is not None:
+        oof.update(zip(ALL_TARGETS, fold_proba[tuple(columns)]))
+    print(f"   {CV_FOLDS + 1} forest fits, {job_s:.1f}s of work on {workers} worker(s)")
 
-    # ── Binary targets ────────────────────────────────────────────────────────
     print(f"\n{'═'*50}")
-    print("  BINARY TARGET CLASSIFIERS")
+    print("  FUSED MULTI-OUTPUT CLASSIFIER")
     print(f"{'═'*50}")
 
-    for target in BINARY_TARGETS:
-        y = df[target].values
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        clf = train_and_evaluate(X_train, X_test, y_train, y_test, target)
-        models[target] = clf
-
-    # ── Feature importance ────────────────────────────────────────────────────
-    feature_importance_report(models, FEATURE_COLS)
-
-    # ── Save everything ───────────────────────────────────────────────────────
-    print(f"\n💾 Saving models to {MODELS_DIR}/...")
-
-    bundle = {
+    forest = fitted[tuple(columns)]
+    cv     = cv_scores[tuple(columns)]
+    models = {}
+    with stage("evaluate"):
+        Y_pred = forest.predict(X[test_idx])
+        for j, target in enumerate(ALL_TARGETS):
+            _print_target(target, Y[test_idx, j], Y_pred[:, j], cv[:, j], encoders.get(target))
+            models[target] = FusedTargetModel(forest, j)
+
+    return models
+
+# ── Probability calibration ───────────────────────────────────────────────────
+def fit_calibration(bundle, X, ys, oof):
+    """
+    Fit one temperature per target on the out-of-fold probabilities of the
+    train rows (`oof`, from train_separate / train_fused), then score the
+    bundle's probabilities before and after scaling on the held-out split,
+    which the fit never saw. Returns {target: {"temperature", and NLL / ECE
+    before and after}}.
+    """
+    _, test_idx, _ = _split(X)
+    proba  = lookup_table.predict_proba(bundle, X[test_idx])
+    result = {}
+    for target in ALL_TARGETS:
+        rows, fold_proba = oof[target]
+        t = calibration.fit_temperature(fold_proba, np.asarray(ys[target])[rows].astype(int))
+        y = np.asarray(ys[target])[test_idx].astype(int)
+        scaled = calibration.apply(proba[target], t)
+        result[target] = {
+            "temperature": round(t, 4),
+            "nll_before":  round(calibration.nll(proba[target], y), 4),
+            "nll_after":   round(calibration.nll(scaled, y), 4),
+            "ece_before":  round(calibration.expected_calibration_error(proba[target], y), 4),
+            "ece_after":   round(calibration.expected_calibration_error(scaled, y), 4),
+        }
+    return result
+
+def calibration_report(fitted):
+    print(f"\n{'═'*72}")
+    print("  PROBABILITY CALIBRATION (fitted out-of-fold, scored on the held-out split)")
+    print(f"{'═'*72}")
+    print(f"  {'target':22s}  {'T':>6s}  {'NLL before':>10s}  {'after':>7s}  {'ECE before':>10s}  {'after':>7s}")
+    for target, c in fitted.items():
+        print(f"  {target:22s}  {c['temperature']:6.3f}  {c['nll_before']:10.4f}  {c['nll_after']:7.4f}"
+              f"  {c['ece_before']:10.4f}  {c['ece_after']:7.4f}")
+
+def build_bundle(models, encoders, temperatures=None):
+    return {
         "models":         models,
         "encoders":       encoders,
         "feature_cols":   FEATURE_COLS,
         "categorical_targets": CATEGORICAL_TARGETS,
         "binary_targets": BINARY_TARGETS,
+        "calibration":    temperatures or {},
     }
-    with open(f"{MODELS_DIR}/ui_model_bundle.pkl", "wb") as f:
-        pickle.dump(bundle, f)
 
-    # Save metadata JSON (feature names, classes) for JS API route reference
-    metadata = {
-        "feature_cols":        FEATURE_COLS,
-        "categorical_targets": CATEGORICAL_TARGETS,
-        "binary_targets":      BINARY_TARGETS,
-        "label_classes": {
-            t: list(encoders[t].classes_) for t in CATEGORICAL_TARGETS
+def read_dataset(path=DATA_PATH):
+    """
+    Load just the columns training needs, with FEATURE_COLS encoded. Columnar
+    files already carry the *_enc ordinals; CSV is encoded after reading.
+    """
+    import pandas as pd
+    needed = FEATURE_COLS + ALL_TARGETS
+    ext    = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return pd.read_parquet(path, columns=needed)
+    if ext in (".feather", ".arrow"):
+        return pd.read_feather(path, columns=needed)
+
+    raw = [c for c in needed if not c.endswith("_enc")] + ["support_level", "info_density_pref", "time_horizon"]
+    return encode_ordinals(pd.read_csv(path, usecols=raw))
+
+def load_training_data(path=DATA_PATH):
+    """Read and encode the dataset. Returns (X, {target: y}, encoders)."""
+    df = read_dataset(path)
+    print(f"   {len(df)} rows × {len(df.columns)} columns")
+
+    X  = df[FEATURE_COLS].values
+    ys, encoders = encode_targets(df)
+    return X, ys, encoders
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Train the UI config model bundle.")
+    parser.add_argument("--fused", action="store_true",
+                        help="train one multi-output forest shared by all targets")
+    parser.add_argument("--data", default=DATA_PATH, help="training set (.csv, .parquet or .feather)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the (target × fold) job graph; 1 runs in-process")
+    parser.add_argument("--search", action="store_true",
+                        help="pick the cheapest n_estimators / max_depth / min_samples_leaf per model "
+                             "within --tolerance of the RF_PARAMS CV accuracy")
+    parser.add_argument("--tolerance", type=float, default=SEARCH_TOLERANCE,
+                        help=f"accuracy the search may give up per target (default {SEARCH_TOLERANCE})")
+    args = parser.parse_args()
+
+    os.makedirs(MODELS_DIR, exist_ok=True)
+
+    print("📂 Loading data...")
+    with stage("load"):
+        X, ys, encoders = load_training_data(args.data)
+
+    # ── Compression search ────────────────────────────────────────────────────
+    found, params = {}, {}
+    if args.search:
+        Y       = np.column_stack([ys[t] for t in ALL_TARGETS])
+        columns = list(range(len(ALL_TARGETS)))
+        groups  = [columns] if args.fused else columns
+        print(f"🔎 Searching {len(search_candidates())} cheaper forests per model...")
+        with stage("search"):
+            found = search_params(X, Y, groups, args.workers, args.tolerance)
+        targets_of = lambda key: [ALL_TARGETS[j] for j in np.atleast_1d(key)]
+        search_report(found, targets_of, args.tolerance)
+        if args.fused:
+            params = found[tuple(columns)]["params"]
+        else:
+            params = {ALL_TARGETS[j]: found[j]["params"] for j in columns}
+
+    oof = {}
+    if args.fused:
+        models = train_fused(X, ys, encoders, args.workers, params, oof)
+    else:
+        models = train_separate(X, ys, encoders, args.workers, params, oof)
+
+    # ── Feature importance ────────────────────────────────────────────────────
+    with stage("importances"):
+        feature_importance_report(models, FEATURE_COLS)
+
+    # ── Probability calibration ───────────────────────────────────────────────
+    with stage("calibrate"):
+        fitted = fit_calibration(build_bundle(models, encoders), X, ys, oof)
+    calibration_report(fitted)
+
+    # ── Save everything ───────────────────────────────────────────────────────
+    print(f"\n💾 Saving models to {MODELS_DIR}/...")
+
+    with stage("save"):
+        bundle = build_bundle(models, encoders, {t: c["temperature"] for t, c in fitted.items()})
+        with open(f"{MODELS_DIR}/ui_model_bundle.pkl", "wb") as f:
+            pickle.dump(bundle, f)
+
+        version = bundle_version(f"{MODELS_DIR}/ui_model_bundle.pkl")
+        flat_forest.publish(bundle, version, f"{MODELS_DIR}/ui_model_flat")
+
+    # Serving cost of what was saved: one-row predicts, per sklearn model and for the flat export
+    with stage("latency"):
+        x_row = X[:1]
+        model_info = {}
+        for j, target in enumerate(ALL_TARGETS):
+            key  = tuple(range(len(ALL_TARGETS))) if args.fused else j
+            info = {
+                "params":     {n: int(dict(RF_PARAMS, **(params if args.fused else params.get(target, {})))[n])
+                               for n in SEARCH_GRID},
+                "predict_ms": round(predict_latency_ms(models[target].predict, x_row), 4),
+            }
+            if key in found:
+                col = j if args.fused else 0
+                info["cv_accuracy"]          = round(float(found[key]["cv"][col]), 4)
+                info["baseline_cv_accuracy"] = round(float(found[key]["baseline_cv"][col]), 4)
+            model_info[target] = info
+        flat_ms = predict_latency_ms(flat_forest.load(f"{MODELS_DIR}/ui_model_flat").predict_codes, x_row)
+
+    with stage("save"):
+
+        # Save metadata JSON (feature names, classes) for JS API route reference
+        metadata = {
+            "feature_cols":        FEATURE_COLS,
+            "categorical_targets": CATEGORICAL_TARGETS,
+            "binary_targets":      BINARY_TARGETS,
+            "label_classes": {
+                t: list(encoders[t].classes_) for t in CATEGORICAL_TARGETS
+            },
+            "models":              model_info,
+            "flat_predict_ms":     round(flat_ms, 4),
+            "calibration":         fitted,
+            "search":              {"tolerance": args.tolerance, "grid": SEARCH_GRID} if args.search else None,
         }
-    }
-    with open(f"{MODELS_DIR}/model_metadata.json", "w") as f:
-        json.dump(metadata, f, indent=2)
+        with open(f"{MODELS_DIR}/model_metadata.json", "w") as f:
+            json.dump(metadata, f, indent=2)
 
-    print(f"✅ Saved  ui_model_bundle.pkl  +  model_metadata.json")
+    print(f"✅ Saved  ui_model_bundle.pkl  +  ui_model_flat/  +  model_metadata.json  (bundle {version})")
 
     # ── Quick sanity test ─────────────────────────────────────────────────────
     print(f"\n{'═'*50}")
@@ -193,6 +606,7 @@ def main():
     for k, v in result.items():
         print(f"    {k:20s}: {v}")
 
+    stage_report()
     print(f"\n🎉 Training complete!")
 
 if __name__ == "__main__":
@@ -1,13 +1,167 @@
+"""
+read_docx.py
+Streaming text extraction from .docx files (syllabi, PRDs) for the syllabus pipeline.
+
+word/document.xml is parsed with iterparse straight from the zip member, and
+every paragraph, table row and body-level element is detached once its text is
+out, so memory stays flat however large the document (or one table in it) is.
+iter_paragraphs yields paragraphs lazily (runs joined, w:tab as a tab,
+w:br/w:cr as a newline); read_docx joins them one per line.
+
+Each input is written to <name>.txt next to it, or under --out-dir, one
+paragraph per line, with --workers processes sharing the batch. Directories
+are searched recursively for *.docx and their layout is mirrored under
+--out-dir; two inputs that would write the same .txt stop the run before it
+starts. A file that cannot be read is reported and skipped; the exit status
+is 1 if any failed.
+
+Run: python3 read_docx.py PRD/Project_Vantage_PRD.docx --out-dir .
+     python3 read_docx.py syllabi/ --out-dir extracted/ --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
 import zipfile
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+PARAGRAPH, TEXT, TAB = f'{W}p', f'{W}t', f'{W}tab'
+BREAKS = (f'{W}br', f'{W}cr')
+BODY, ROW = f'{W}body', f'{W}tr'
+
+# ── Extraction ────────────────────────────────────────────────────────────────
+def iter_paragraphs(path):
+    """Yields the text of each non-empty paragraph of a .docx, in document order."""
+    with zipfile.ZipFile(path) as docx, docx.open('word/document.xml') as xml:
+        open_ = []     # elements started but not yet ended: open_[-1] is the parent of an ending element
+        parts = []     # one list of text pieces per open paragraph (text boxes nest them)
+        for event, elem in ET.iterparse(xml, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                open_.append(elem)
+                if tag == PARAGRAPH:
+                    parts.append([])
+                continue
+
+            open_.pop()
+            if tag == TEXT and parts:
+                parts[-1].append(elem.text or '')
+            elif tag == TAB and parts:
+                parts[-1].append('\t')
+            elif tag in BREAKS and parts:
+                parts[-1].append('\n')
+            elif tag == PARAGRAPH:
+                text = ''.join(parts.pop())
+                if text.strip():
+                    yield text
+            if tag in (PARAGRAPH, ROW) or (open_ and open_[-1].tag == BODY):
+                # Done with it: detach from its parent (it is the last child) so nothing accumulates,
+                # whether it sits in the body, a table cell or a long table
+                del open_[-1][-1]
 
 def read_docx(path):
-    with zipfile.ZipFile(path) as docx:
-        tree = ET.fromstring(docx.read('word/document.xml'))
-        namespaces = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-        return '\n'.join([node.text for node in tree.findall('.//w:t', namespaces) if node.text])
+    """The whole text of a .docx, one paragraph per line."""
+    return '\n'.join(iter_paragraphs(path))
+
+# ── Batch ─────────────────────────────────────────────────────────────────────
+def find_inputs(paths):
+    """Yields (path, name) per input; name is relative to the directory it was found under."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.lower().endswith('.docx') and not name.startswith('~$'):
+                        full = os.path.join(root, name)
+                        yield full, os.path.relpath(full, path)
+        else:
+            yield path, os.path.basename(path)
+
+def output_path(path, name, out_dir):
+    """<out-dir>/<name>.txt, mirroring subdirectories, or <name>.txt next to the input."""
+    if out_dir is None:
+        return os.path.splitext(path)[0] + '.txt'
+    return os.path.join(out_dir, os.path.splitext(name)[0] + '.txt')
+
+def extract_file(job):
+    """Stream one document to its .txt. Returns (path, paragraphs, chars, error or None)."""
+    path, out = job
+    paragraphs = chars = 0
+    try:
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        with open(out, 'w', encoding='utf-8') as f:
+            for text in iter_paragraphs(path):
+                f.write(text + '\n')
+                paragraphs += 1
+                chars      += len(text)
+    except Exception as e:
+        # Any failure is this document's alone (corrupt deflate data, encrypted members, ...)
+        if os.path.exists(out):
+            os.remove(out)   # no half-written .txt that looks like a result
+        return path, paragraphs, chars, f'{type(e).__name__}: {e}'
+    return path, paragraphs, chars, None
+
+def extract_all(jobs, workers):
+    """Yields extract_file results in input order."""
+    if workers <= 1:
+        yield from map(extract_file, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(extract_file, jobs, chunksize=4)
+
+def peak_rss_mb():
+    """Largest resident set of this process or any finished worker, or None where unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KB on Linux
+    return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / 1024
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description='Extract paragraph text from .docx files.')
+    parser.add_argument('paths', nargs='+', help='.docx files, or directories searched for them')
+    parser.add_argument('--out-dir', help='where the .txt files go (default: next to each input)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='extraction processes; 1 extracts in-process')
+    args = parser.parse_args()
+
+    inputs = list(find_inputs(args.paths))
+    if not inputs:
+        parser.error('no .docx files found')
+    jobs = [(path, output_path(path, name, args.out_dir)) for path, name in inputs]
+
+    # Two inputs writing one .txt would silently keep only the last
+    seen = {}
+    for path, out in jobs:
+        key = os.path.normcase(os.path.abspath(out))
+        if key in seen:
+            parser.error(f'{seen[key]} and {path} would both write {out}')
+        seen[key] = path
+
+    t0 = time.perf_counter()
+    done = failed = paragraphs = chars = 0
+    size = sum(os.path.getsize(path) for path, _ in inputs if os.path.isfile(path))
+    for path, n_paragraphs, n_chars, error in extract_all(jobs, args.workers):
+        if error:
+            failed += 1
+            print(f'⚠️  {path}: {error}', file=sys.stderr)
+            continue
+        done       += 1
+        paragraphs += n_paragraphs
+        chars      += n_chars
+
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    peak    = peak_rss_mb()
+    print(f'✅ Extracted {done:,} of {len(inputs):,} documents ({paragraphs:,} paragraphs, {chars:,} chars) '
+          f'in {elapsed:.2f}s — {len(inputs) / elapsed:,.1f} docs/s, {size / 1e6 / elapsed:,.1f} MB/s, '
+          f'{args.workers} worker(s)' + (f', peak RSS {peak:.0f} MB' if peak is not None else ''), file=sys.stderr)
+    if failed:
+        sys.exit(1)
 
 if __name__ == '__main__':
-    text = read_docx(r'c:\Users\hares\OneDrive\Desktop\CS_Projects\IBMHack\PRD\Project_Vantage_PRD.docx')
-    with open(r'c:\Users\hares\OneDrive\Desktop\CS_Projects\IBMHack\prd_text.txt', 'w', encoding='utf-8') as f:
-        f.write(text)
+    main()